@@ -0,0 +1,32 @@
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+from app.config import (
+    OPENAI_API_KEY,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE,
+    OPENAI_TIMEOUT,
+)
+
+# One connection pool per client, shared by every module that talks to OpenAI.
+# The async client carries the request handlers, so its pool is sized for
+# hundreds of concurrent LLM calls; the sync one serves ingestion threads.
+# Retries are left to app.rate_limit, which coordinates them process-wide.
+limits = httpx.Limits(
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    max_keepalive_connections=OPENAI_MAX_KEEPALIVE
+)
+
+openai_client = OpenAI(
+    api_key=OPENAI_API_KEY,
+    timeout=OPENAI_TIMEOUT,
+    max_retries=0,
+    http_client=DefaultHttpxClient(limits=limits)
+)
+
+async_openai_client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    timeout=OPENAI_TIMEOUT,
+    max_retries=0,
+    http_client=DefaultAsyncHttpxClient(limits=limits)
+)
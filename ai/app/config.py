@@ -5,11 +5,197 @@ load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Shared HTTP connection pool for the OpenAI clients
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "500"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "100"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+
 EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
 LLM_MODEL = "gpt-4o-mini"
 
-CHUNK_SIZE = 500
-CHUNK_OVERLAP = 100
+# Worker processes serving the app (uvicorn --workers). Per-process limits
+# below are divided by it.
+WORKER_PROCESSES = max(1, int(os.getenv("WORKER_PROCESSES", "1")))
+
+# OpenAI rate limits for the whole deployment (match the account tier); each
+# process gets an equal share. 429s and transient errors back off
+# exponentially with jitter, honoring Retry-After.
+LLM_REQUESTS_PER_MIN = int(os.getenv("LLM_REQUESTS_PER_MIN", "5000")) // WORKER_PROCESSES
+LLM_TOKENS_PER_MIN = int(os.getenv("LLM_TOKENS_PER_MIN", "2000000")) // WORKER_PROCESSES
+EMBED_REQUESTS_PER_MIN = int(os.getenv("EMBED_REQUESTS_PER_MIN", "5000")) // WORKER_PROCESSES
+EMBED_TOKENS_PER_MIN = int(os.getenv("EMBED_TOKENS_PER_MIN", "5000000")) // WORKER_PROCESSES
+RATE_LIMIT_MAX_RETRIES = 5
+RATE_LIMIT_BACKOFF_BASE = 1.0
+RATE_LIMIT_BACKOFF_MAX = 30.0
+# Completion-size estimates used to charge the token bucket before a call
+GENERATION_TOKENS_PER_QUESTION = 250
+REFINE_OUTPUT_TOKENS = 600
+
+# Batch refinement packs questions into shared calls of this size
+REFINE_BATCH_MAX_ITEMS = 10
+REFINE_BATCH_MAX_TOKENS = 4000
+
+# Chunk sizes are in embedding-model tokens. Chunks break at sentence and
+# heading boundaries, and short consecutive sections share a chunk.
+CHUNK_MAX_TOKENS = 600
+CHUNK_OVERLAP_TOKENS = 75
+CHUNK_MIN_TOKENS = 300
+
+# Indexing: chunks are embedded in batches (one embeddings request per batch)
+# and a few batches are kept in flight at once.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "96"))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "100000"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# Max items waiting between ingestion pipeline stages (sections, batches).
+PIPELINE_QUEUE_SIZE = 8
+
+# Embedding cache keyed by (EMBEDDING_MODEL, sha256(text)).
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+EMBED_CACHE_LRU_SIZE = int(os.getenv("EMBED_CACHE_LRU_SIZE", "5000"))
+
+# Before embedding, lines repeated across pages (headers, footers, page
+# numbers) are stripped and chunks that are near-duplicates of an earlier
+# chunk of the same document (MinHash/LSH estimated Jaccard) are skipped.
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_SIMILARITY = 0.85
+DEDUP_NUM_PERM = 64
+DEDUP_BANDS = 16
+# A short line is boilerplate once seen on this many pages and this share
+# of the pages so far; the first BOILERPLATE_WINDOW pages are held back
+# until their repeated lines are known.
+BOILERPLATE_MIN_PAGES = 3
+BOILERPLATE_MIN_FRACTION = 0.2
+BOILERPLATE_WINDOW = 10
+
+# Uploads are streamed to unique temp files; parsing/indexing runs as
+# background ingestion jobs on a worker pool.
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None  # None -> system temp dir
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Queued + running ingestion jobs allowed before submissions get a 429.
+MAX_INGEST_JOBS = int(os.getenv("MAX_INGEST_JOBS", "32"))
+
+# PDF extraction: "pdfium" (fast, needs pypdfium2) or "pdfplumber".
+# Pages flagged as mangled by pdfium are re-extracted with pdfplumber.
+PDF_ENGINE = os.getenv("PDF_ENGINE", "pdfium")
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = 25
+PDF_PARALLEL_MIN_PAGES = 50
+
+# Pooled headless Chromium for URL ingestion (see app/ingestion/browser.py).
+# Each context renders one page at a time and is recycled after N pages.
+BROWSER_MAX_CONTEXTS = int(os.getenv("BROWSER_MAX_CONTEXTS", "4"))
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "4"))
+BROWSER_PAGES_PER_CONTEXT = int(os.getenv("BROWSER_PAGES_PER_CONTEXT", "20"))
+BROWSER_NAV_TIMEOUT_MS = 45000
+BROWSER_IDLE_TIMEOUT_MS = 5000
+
+# URL ingestion tries a plain HTTP fetch first and only renders with the
+# browser when the static result is too short or looks JS-gated.
+HTML_CACHE_DIR = os.getenv("HTML_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../html_cache"))
+STATIC_FETCH_TIMEOUT = 15.0
+
+# Retrieval: k scales with the requested question count, bounded by a
+# context token budget. Topic queries fuse vector and BM25 results and are
+# diversified with MMR.
+RETRIEVAL_MIN_K = 4
+RETRIEVAL_MAX_K = 24
+QUESTIONS_PER_CHUNK = 2
+RETRIEVAL_TOKEN_BUDGET = 12000
+MMR_LAMBDA = 0.6
+MMR_FETCH_MULTIPLIER = 3
+# Rank constant for fusing vector and BM25 rankings (reciprocal rank fusion)
+HYBRID_RRF_K = 60
+
+# Context sent to the LLM is fitted to min(MAX, MIN + count * per-question
+# tokens * mode factor); chunks are cut at sentence boundaries to fit
+CONTEXT_MIN_TOKENS = 1500
+CONTEXT_TOKENS_PER_QUESTION = 400
+CONTEXT_MODE_FACTORS = {"mcq": 1.0, "text": 1.0, "mixed": 1.0, "true_false": 0.6}
+CONTEXT_MAX_TOKENS = RETRIEVAL_TOKEN_BUDGET
+# A chunk whose share of the budget would be below this is dropped instead
+CONTEXT_MIN_CHUNK_TOKENS = 80
+
+# Large question counts are split into parallel LLM calls of about
+# GENERATION_SHARD_SIZE questions over disjoint chunk subsets
+GENERATION_SHARD_SIZE = 10
+GENERATION_MAX_SHARDS = 5
+# Jaccard similarity of question terms above which a question is a duplicate
+GENERATION_DEDUP_THRESHOLD = 0.8
+
+# Question bank (opt-in, since it spends LLM calls on every upload): after
+# ingestion, QUESTION_BANK_TARGET questions are pre-generated per
+# difficulty x mode in the background; topic-less /generate requests for a
+# banked combination are served from it, and a combination below
+# QUESTION_BANK_LOW_WATER is topped up asynchronously.
+QUESTION_BANK_ENABLED = os.getenv("QUESTION_BANK_ENABLED", "false").lower() == "true"
+QUESTION_BANK_DIFFICULTIES = ["easy", "medium", "hard"]
+QUESTION_BANK_MODES = ["mcq", "true_false"]
+QUESTION_BANK_MCQ_OPTIONS = 4
+QUESTION_BANK_TARGET = 20
+QUESTION_BANK_LOW_WATER = 10
+
+# Generation cache (Redis when reachable, in-process LRU otherwise). Redis
+# is connected on first use and, after a failure, retried with backoff up to
+# GENERATION_CACHE_REDIS_RETRY_MAX seconds apart.
+# With more than one variant per key, repeat requests rotate between them.
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6389/0")
+GENERATION_CACHE_TTL = int(os.getenv("GENERATION_CACHE_TTL", str(24 * 3600)))
+GENERATION_CACHE_MAX_ENTRIES = 512
+GENERATION_CACHE_VARIANTS = int(os.getenv("GENERATION_CACHE_VARIANTS", "1"))
+GENERATION_CACHE_REDIS_RETRY_MAX = 60
+
+# Document lifecycle: uploads may carry a TTL (DOCUMENT_DEFAULT_TTL seconds
+# when none is given; 0 keeps documents until deleted). A background sweeper
+# deletes expired documents every LIFECYCLE_SWEEP_INTERVAL seconds and
+# compacts the store once COMPACT_MIN_DELETED_CHUNKS chunks were deleted.
+DOCUMENT_DEFAULT_TTL = int(os.getenv("DOCUMENT_DEFAULT_TTL", "0"))
+LIFECYCLE_SWEEP_INTERVAL = int(os.getenv("LIFECYCLE_SWEEP_INTERVAL", "300"))
+COMPACT_MIN_DELETED_CHUNKS = int(os.getenv("COMPACT_MIN_DELETED_CHUNKS", "5000"))
 
 VECTOR_DB_PATH = "data/chroma"
 COLLECTION_NAME = "documents"
+
+# With CHROMA_HOST set, vectors live in a Chroma server (`chroma run`, or the
+# chromadb service in docker-compose.yml) that owns the store, which is
+# required when WORKER_PROCESSES > 1. Otherwise the process opens
+# chroma_db/ itself, which is only safe for a single worker.
+# VECTOR_STATE_DIR (default ai/chroma_db) holds the local store and the
+# shared SQLite state: registry, jobs, question bank and embedding cache.
+# Fetched pages are cached separately, in HTML_CACHE_DIR.
+VECTOR_STATE_DIR = os.getenv("VECTOR_STATE_DIR") or os.path.join(os.path.dirname(__file__), "../chroma_db")
+CHROMA_HOST = os.getenv("CHROMA_HOST") or None
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
+# Collection handles are re-resolved after this long when the store is
+# remote; a call on a collection another worker dropped in the meantime is
+# retried once on a re-resolved handle
+VECTOR_REMOTE_HANDLE_TTL = 30
+# The other state next to the store (registry, jobs, question bank, caches)
+# is SQLite in WAL mode, shared by all workers; writers wait this long for
+# a lock held by another process.
+SQLITE_BUSY_TIMEOUT = 30
+# Workers refresh the rows of their queued and running jobs every third of
+# this; a row not refreshed for this long belongs to a dead worker
+JOB_STALE_SECONDS = 900
+
+# Chunks are sharded across Chroma collections so a document's reads and
+# writes only touch its own HNSW index: "document" (one collection per
+# document), "tenant" (one per tenant, the part of the document id before
+# TENANT_SEPARATOR) or "single" (everything in COLLECTION_NAME, as before).
+# Move an existing single collection over with `python -m app.vectorstore.migrate`.
+VECTOR_SHARD_BY = os.getenv("VECTOR_SHARD_BY", "document")
+TENANT_SEPARATOR = ":"
+# HNSW parameters per shard kind, applied when a shard is created
+# (existing shards keep the parameters they were created with)
+VECTOR_HNSW_PARAMS = {
+    "document": {"hnsw:space": "l2", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 64},
+    "tenant": {"hnsw:space": "l2", "hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 100},
+    "single": {},
+}
+# Open collection handles kept by the router (LRU)
+VECTOR_MAX_OPEN_COLLECTIONS = 256
+# Memory for loaded HNSW segments; least recently used segments are
+# unloaded beyond it (0 = no limit)
+VECTOR_MEMORY_LIMIT_BYTES = int(os.getenv("VECTOR_MEMORY_LIMIT_BYTES", "0"))
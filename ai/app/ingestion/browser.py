@@ -0,0 +1,155 @@
+import asyncio
+import threading
+
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
+
+from app.config import (
+    BROWSER_MAX_CONTEXTS,
+    BROWSER_MAX_PAGES,
+    BROWSER_PAGES_PER_CONTEXT,
+    BROWSER_NAV_TIMEOUT_MS,
+    BROWSER_IDLE_TIMEOUT_MS,
+)
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+BLOCKED_RESOURCES = {"image", "font", "media"}
+
+
+class BrowserPool:
+    """
+    One long-lived headless Chromium per process, shared by all URL ingests.
+
+    Playwright's async API runs on a private event loop thread; sync callers
+    (ingestion job workers) go through render(). Browser contexts are reused
+    and recycled after `pages_per_context` pages, and at most `max_pages`
+    pages are open at once.
+    """
+
+    def __init__(self, max_contexts: int, max_pages: int, pages_per_context: int):
+        self.max_contexts = max_contexts
+        self.max_pages = max_pages
+        self.pages_per_context = pages_per_context
+        self.loop = None
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.playwright = None
+        self.browser = None
+        self.idle = None
+        self.page_slots = None
+        self.context_slots = None
+        self.launch_lock = None
+        self.served = {}
+
+    def render(self, url: str) -> str:
+        """
+        Returns the rendered HTML for `url`. Blocks the calling thread.
+        """
+        self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._render(url), self.loop)
+        return future.result()
+
+    def close(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop = None
+
+    def _ensure_loop(self):
+        with self.start_lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            self.page_slots = asyncio.Semaphore(self.max_pages)
+            self.context_slots = asyncio.Semaphore(self.max_contexts)
+            self.launch_lock = asyncio.Lock()
+            self.idle = asyncio.Queue()
+            self.thread = threading.Thread(target=self.loop.run_forever, name="browser-pool", daemon=True)
+            self.thread.start()
+
+    async def _ensure_browser(self):
+        async with self.launch_lock:
+            if self.browser is not None and self.browser.is_connected():
+                return
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+            print("[DEBUG] Launching pooled Chromium")
+            self.browser = await self.playwright.chromium.launch(headless=True)
+            # contexts from a crashed browser are useless
+            self.idle = asyncio.Queue()
+            self.served = {}
+
+    async def _acquire_context(self):
+        # Caller holds a context slot, so idle + in-use contexts never exceed max_contexts
+        await self._ensure_browser()
+        if not self.idle.empty():
+            return self.idle.get_nowait()
+        context = await self.browser.new_context(user_agent=USER_AGENT)
+        await context.route("**/*", self._block_heavy_resources)
+        self.served[context] = 0
+        return context
+
+    async def _release_context(self, context):
+        self.served[context] = self.served.get(context, 0) + 1
+        if self.served[context] >= self.pages_per_context or not self.browser.is_connected():
+            self.served.pop(context, None)
+            try:
+                await context.close()
+            except Exception:
+                pass
+            return
+        self.idle.put_nowait(context)
+
+    async def _block_heavy_resources(self, route):
+        if route.request.resource_type in BLOCKED_RESOURCES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _render(self, url: str) -> str:
+        async with self.page_slots, self.context_slots:
+            context = await self._acquire_context()
+            try:
+                page = await context.new_page()
+            except Exception:
+                await self._release_context(context)
+                raise
+            try:
+                await page.goto(url, wait_until="domcontentloaded", timeout=BROWSER_NAV_TIMEOUT_MS)
+                try:
+                    await page.wait_for_load_state("networkidle", timeout=BROWSER_IDLE_TIMEOUT_MS)
+                except PlaywrightTimeout:
+                    # Long-polling/analytics pages never go idle; settle for visible text
+                    try:
+                        await page.wait_for_function(
+                            "document.body && document.body.innerText.length > 200",
+                            timeout=BROWSER_IDLE_TIMEOUT_MS
+                        )
+                    except PlaywrightTimeout:
+                        pass
+                return await page.content()
+            finally:
+                await page.close()
+                await self._release_context(context)
+
+    async def _close(self):
+        for context in list(self.served):
+            try:
+                await context.close()
+            except Exception:
+                pass
+        self.served = {}
+        if self.browser is not None:
+            await self.browser.close()
+            self.browser = None
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+
+browser_pool = BrowserPool(
+    max_contexts=BROWSER_MAX_CONTEXTS,
+    max_pages=BROWSER_MAX_PAGES,
+    pages_per_context=BROWSER_PAGES_PER_CONTEXT
+)
@@ -1,14 +1,151 @@
-from app.config import CHUNK_SIZE, CHUNK_OVERLAP
+import math
+import re
 
-def chunk_text(text: str):
-    words = text.split()
-    chunks = []
+from app.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_MIN_TOKENS
+from app.tokens import count_tokens_batch
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# "12.1 Introduction", "Chapter 3 ...", "Appendix B" (a bare leading number is
+# too common in wrapped body lines to count)
+NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)+\.?\s+[A-Z]|(chapter|section|part|appendix)\s+\w)", re.IGNORECASE)
+SOURCE_RE = re.compile(r"^(?P<name>.*) \((?P<kind>Page|Slide)s? (?P<first>\d+)(?:–(?P<last>\d+))?\)$")
+
+
+def is_heading(line: str) -> bool:
+    if len(line) > 80 or line.endswith((".", ",", ";", ":")):
+        return False
+    if NUMBERED_HEADING.match(line):
+        return True
+    return line.isupper() and sum(c.isalpha() for c in line) >= 4
+
+
+def split_units(text: str) -> list[tuple[str, bool]]:
+    """
+    Splits text into (unit, is_heading) pairs, where a unit is a heading
+    line or a sentence. Lines within a paragraph are re-joined first, since
+    PDF extraction breaks lines at the page width.
+    """
+    units = []
+    for block in re.split(r"\n\s*\n", text):
+        body = []
+        for line in block.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if is_heading(line):
+                if body:
+                    units.extend((s, False) for s in SENTENCE_END.split(" ".join(body)) if s)
+                    body = []
+                units.append((line, True))
+            else:
+                body.append(line)
+        if body:
+            units.extend((s, False) for s in SENTENCE_END.split(" ".join(body)) if s)
+    return units
+
+
+def split_long(unit: str, tokens: int, max_tokens: int) -> list[tuple[str, int]]:
+    # A "sentence" longer than a chunk (tables, code, run-on text): cut by words
+    words = unit.split()
+    pieces = math.ceil(tokens / max_tokens)
+    size = math.ceil(len(words) / pieces)
+    return [
+        (" ".join(words[i:i + size]), math.ceil(tokens / pieces))
+        for i in range(0, len(words), size)
+    ]
+
+
+def label_sources(sources: list[str]) -> str:
+    """
+    "file.pdf (Page 3)" + "file.pdf (Page 4)" -> "file.pdf (Pages 3–4)".
+    Sources that can't be merged (e.g. URLs, several files) keep the first.
+    """
+    unique = list(dict.fromkeys(sources))
+    if len(unique) == 1:
+        return unique[0]
+
+    matches = [SOURCE_RE.match(s) for s in unique]
+    if all(matches) and len({(m["name"], m["kind"]) for m in matches}) == 1:
+        numbers = [int(n) for m in matches for n in (m["first"], m["last"]) if n]
+        return f"{matches[0]['name']} ({matches[0]['kind']}s {min(numbers)}–{max(numbers)})"
+    return unique[0]
 
-    start = 0
-    while start < len(words):
-        end = start + CHUNK_SIZE
-        chunk_words = words[start:end]
-        chunks.append(" ".join(chunk_words))
-        start += CHUNK_SIZE - CHUNK_OVERLAP
 
-    return chunks
+class ChunkPacker:
+    """
+    Packs sentence/heading units from consecutive sections into chunks of
+    up to `max_tokens` model tokens. Small sections (short pages, slides)
+    share a chunk; a heading starts a new chunk once the current one holds
+    at least `min_tokens`. Consecutive chunks overlap by up to
+    `overlap_tokens` of trailing sentences.
+    """
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS, min_tokens: int = CHUNK_MIN_TOKENS):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens
+        self.units = []  # (text, tokens, source, is_heading)
+        self.tokens = 0
+        self.fresh = 0  # tokens added since the last emitted chunk
+
+    def add(self, section: dict):
+        """
+        Feeds one section; yields any chunks it completes.
+        """
+        units = split_units(section["text"])
+        counts = count_tokens_batch([u for u, _ in units])
+
+        for (unit, heading), tokens in zip(units, counts):
+            pieces = split_long(unit, tokens, self.max_tokens) if tokens > self.max_tokens else [(unit, tokens)]
+            for text, n in pieces:
+                if heading and self.fresh >= self.min_tokens:
+                    yield self.emit(overlap=False)
+                elif self.tokens + n > self.max_tokens and self.fresh:
+                    yield self.emit(overlap=True)
+                if self.tokens + n > self.max_tokens:
+                    # carried-over overlap never pushes a chunk past the limit
+                    self.units, self.tokens = [], 0
+                self.units.append((text, n, section["source"], heading))
+                self.tokens += n
+                self.fresh += n
+
+    def flush(self):
+        if self.fresh:
+            yield self.emit(overlap=False)
+
+    def emit(self, overlap: bool) -> dict:
+        parts = []
+        for text, _, _, heading in self.units:
+            parts.append(f"\n{text}\n" if heading else text)
+        chunk = {
+            "text": " ".join(parts).replace(" \n", "\n").replace("\n ", "\n").strip(),
+            "source": label_sources([source for _, _, source, _ in self.units]),
+            "tokens": self.tokens
+        }
+
+        carried = []
+        if overlap:
+            budget = self.overlap_tokens
+            for unit in reversed(self.units):
+                if unit[1] > budget:
+                    break
+                carried.insert(0, unit)
+                budget -= unit[1]
+        self.units = carried
+        self.tokens = sum(u[1] for u in carried)
+        self.fresh = 0
+        return chunk
+
+
+def chunk_sections(sections):
+    """
+    Lazily chunks an iterable of sections into {"text", "source", "tokens"} dicts.
+    """
+    packer = ChunkPacker()
+    for section in sections:
+        yield from packer.add(section)
+    yield from packer.flush()
+
+
+def chunk_text(text: str):
+    return [c["text"] for c in chunk_sections([{"source": "", "text": text}])]
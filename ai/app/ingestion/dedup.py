@@ -0,0 +1,121 @@
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from app.config import (
+    BOILERPLATE_MIN_PAGES,
+    BOILERPLATE_MIN_FRACTION,
+    BOILERPLATE_WINDOW,
+    DEDUP_SIMILARITY,
+    DEDUP_NUM_PERM,
+    DEDUP_BANDS,
+)
+
+DIGITS = re.compile(r"\d+")
+SPACES = re.compile(r"\s+")
+MAX_BOILERPLATE_LINE = 120
+SHINGLE_SIZE = 5
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def normalize_line(line: str) -> str:
+    # "Page 12 of 380" and "Page 13 of 380" are the same footer
+    return SPACES.sub(" ", DIGITS.sub("#", line.strip().lower()))
+
+
+class BoilerplateFilter:
+    """
+    Strips lines that repeat across pages: running headers and footers,
+    page numbers, copyright lines, slide-template text. A short line is
+    boilerplate once it has appeared on at least `min_pages` pages and on
+    `min_fraction` of the pages seen so far; that decision is sticky.
+    The first `window` sections are buffered so their own headers are
+    learned before they are passed on.
+    """
+
+    def __init__(self, min_pages: int = BOILERPLATE_MIN_PAGES, min_fraction: float = BOILERPLATE_MIN_FRACTION, window: int = BOILERPLATE_WINDOW):
+        self.min_pages = min_pages
+        self.min_fraction = min_fraction
+        self.window = window
+        self.pages = 0
+        self.line_pages = Counter()
+        self.boilerplate = set()
+        self.lines_stripped = 0
+
+    def observe(self, section: dict):
+        self.pages += 1
+        lines = {normalize_line(l) for l in section["text"].splitlines()}
+        for line in lines:
+            if line and len(line) <= MAX_BOILERPLATE_LINE:
+                self.line_pages[line] += 1
+                seen = self.line_pages[line]
+                if seen >= self.min_pages and seen >= self.min_fraction * self.pages:
+                    self.boilerplate.add(line)
+
+    def strip(self, section: dict) -> dict:
+        if not self.boilerplate:
+            return section
+        kept = []
+        for line in section["text"].splitlines():
+            if normalize_line(line) in self.boilerplate:
+                self.lines_stripped += 1
+            else:
+                kept.append(line)
+        return dict(section, text="\n".join(kept))
+
+    def filter(self, sections):
+        buffered = []
+        for section in sections:
+            self.observe(section)
+            if len(buffered) < self.window:
+                buffered.append(section)
+                continue
+            for held in buffered:
+                yield self.strip(held)
+            buffered = []
+            yield self.strip(section)
+        for held in buffered:
+            yield self.strip(held)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures over word shingles with LSH banding. seen_before()
+    reports whether a text's estimated Jaccard similarity to an earlier
+    one reaches `threshold`, and remembers it if not.
+    """
+
+    def __init__(self, threshold: float = DEDUP_SIMILARITY, num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = []
+
+    def signature(self, text: str) -> np.ndarray:
+        words = text.lower().split()
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) % MERSENNE_PRIME for s in shingles), dtype=np.int64, count=len(shingles))
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def seen_before(self, text: str) -> bool:
+        sig = self.signature(text)
+        keys = [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+        candidates = set()
+        for band, key in zip(self.buckets, keys):
+            candidates.update(band.get(key, ()))
+        for idx in candidates:
+            if np.mean(self.signatures[idx] == sig) >= self.threshold:
+                return True
+
+        idx = len(self.signatures)
+        self.signatures.append(sig)
+        for band, key in zip(self.buckets, keys):
+            band.setdefault(key, []).append(idx)
+        return False
@@ -0,0 +1,128 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from app.config import SQLITE_BUSY_TIMEOUT
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache.
+    Keys are (model, sha256(text)). A small in-process LRU sits in front of
+    a SQLite table holding float32 vectors; the table is trimmed back to
+    `max_entries` by least-recent use. The row count is kept in memory and
+    recounted only before a trim, or after a tenth of `max_entries` rows
+    were inserted (other processes sharing the file insert too).
+    """
+
+    def __init__(self, path: str, model: str, max_entries: int, lru_size: int):
+        self.model = model
+        self.max_entries = max_entries
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self.db = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                key TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, key)
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.db.commit()
+        (self.count,) = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        self.unsynced = 0  # rows inserted since the last recount
+
+    def _remember(self, key: str, vector: list[float]):
+        self.lru[key] = vector
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        keys = [text_key(t) for t in texts]
+        found = {}
+
+        with self.lock:
+            for key in keys:
+                if key in self.lru:
+                    self.lru.move_to_end(key)
+                    found[key] = self.lru[key]
+                    self.stats["memory_hits"] += 1
+
+            missing = [k for k in set(keys) if k not in found]
+            # SQLite caps bound parameters, so look keys up in slices
+            for i in range(0, len(missing), 500):
+                part = missing[i:i + 500]
+                rows = self.db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(part))})",
+                    [self.model, *part]
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.stats["disk_hits"] += 1
+                if rows:
+                    self.db.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                        [(time.time(), self.model, key) for key, _ in rows]
+                    )
+            self.db.commit()
+
+            results = [found.get(k) for k in keys]
+            self.stats["misses"] += sum(1 for r in results if r is None)
+        return results
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]):
+        now = time.time()
+        rows = []
+        with self.lock:
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                self._remember(key, vector)
+                rows.append((self.model, key, array("f", vector).tobytes(), now))
+            # a row already there (another worker embedded the same text)
+            # holds the same vector
+            added = self.db.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?)", rows).rowcount
+            self.count += added
+            self.unsynced += added
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        if self.count <= self.max_entries and self.unsynced < self.max_entries // 10:
+            return
+        (self.count,) = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        self.unsynced = 0
+        if self.count <= self.max_entries:
+            return
+        # Trim a little below the cap so we don't evict on every insert
+        excess = self.count - int(self.max_entries * 0.9)
+        deleted = self.db.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        ).rowcount
+        self.count -= deleted
+        self.stats["evictions"] += deleted
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            total = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = total - self.stats["misses"]
+            return {**self.stats, "hit_rate": round(hits / total, 3) if total else 0.0}
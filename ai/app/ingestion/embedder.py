@@ -1,11 +1,101 @@
-from openai import OpenAI
-from app.config import OPENAI_API_KEY, EMBEDDING_MODEL
+import asyncio
+import os
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+from app.clients import openai_client, async_openai_client
+from app.config import (
+    EMBEDDING_MODEL,
+    EMBED_CACHE_ENABLED,
+    EMBED_CACHE_MAX_ENTRIES,
+    EMBED_CACHE_LRU_SIZE,
+)
+from app.ingestion.embed_cache import EmbeddingCache
+from app.rate_limit import embedding_scheduler, estimate_embedding_tokens
+from app.vectorstore.chroma import DB_DIR
 
-def embed(text: str) -> list[float]:
-    res = client.embeddings.create(
+client = openai_client
+async_client = async_openai_client
+
+CACHE_PATH = os.path.join(DB_DIR, "embedding_cache.db")
+cache = EmbeddingCache(
+    CACHE_PATH,
+    model=EMBEDDING_MODEL,
+    max_entries=EMBED_CACHE_MAX_ENTRIES,
+    lru_size=EMBED_CACHE_LRU_SIZE
+) if EMBED_CACHE_ENABLED else None
+
+
+def embed(text: str, lane: str = "generate") -> list[float]:
+    return embed_batch([text], lane=lane)[0]
+
+
+async def embed_async(text: str, lane: str = "generate") -> list[float]:
+    return (await embed_batch_async([text], lane=lane))[0]
+
+
+def embed_batch(texts: list[str], lane: str = "bulk") -> list[list[float]]:
+    """
+    Embeds several texts with a single API request.
+    Vectors are returned in the same order as `texts`.
+    Texts already in the embedding cache are not sent to the API.
+    `lane` is the rate-limiter priority (ingestion runs as bulk work).
+    """
+    if not texts:
+        return []
+
+    vectors, missing = _cached(texts)
+    if missing:
+        vectors = _merge(texts, vectors, missing, _embed_uncached(missing, lane))
+    return vectors
+
+
+async def embed_batch_async(texts: list[str], lane: str = "generate") -> list[list[float]]:
+    """
+    Coroutine version of embed_batch for request handlers. Cache reads and
+    writes (SQLite, shared with ingestion threads and other workers) run
+    in a worker thread so a busy cache never blocks the event loop.
+    """
+    if not texts:
+        return []
+
+    vectors, missing = await asyncio.to_thread(_cached, texts)
+    if missing:
+        embedded = await _embed_uncached_async(missing, lane)
+        vectors = await asyncio.to_thread(_merge, texts, vectors, missing, embedded)
+    return vectors
+
+
+def _cached(texts: list[str]):
+    # -> (vectors with None for cache misses, unique missing texts)
+    if cache is None:
+        return [None] * len(texts), list(dict.fromkeys(texts))
+    vectors = cache.get_many(texts)
+    return vectors, list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+
+
+def _merge(texts, vectors, missing, embedded):
+    fresh = dict(zip(missing, embedded))
+    if cache is not None:
+        cache.put_many(missing, embedded)
+    return [v if v is not None else fresh[t] for t, v in zip(texts, vectors)]
+
+
+def _embed_uncached(texts: list[str], lane: str) -> list[list[float]]:
+    res = embedding_scheduler.call(
+        client.embeddings.create,
+        tokens=estimate_embedding_tokens(texts),
+        lane=lane,
+        model=EMBEDDING_MODEL,
+        input=texts
+    )
+    return [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
+
+
+async def _embed_uncached_async(texts: list[str], lane: str) -> list[list[float]]:
+    res = await embedding_scheduler.call_async(
+        async_client.embeddings.create,
+        tokens=estimate_embedding_tokens(texts),
+        lane=lane,
         model=EMBEDDING_MODEL,
-        input=text
+        input=texts
     )
-    return res.data[0].embedding
+    return [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import httpx
+
+from app.config import HTML_CACHE_DIR, STATIC_FETCH_TIMEOUT
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# Shared connection pool for static fetches
+http_client = httpx.Client(
+    headers={"User-Agent": USER_AGENT},
+    follow_redirects=True,
+    timeout=STATIC_FETCH_TIMEOUT,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+)
+
+
+def cache_paths(url: str) -> tuple[str, str]:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(HTML_CACHE_DIR, f"{key}.html"), os.path.join(HTML_CACHE_DIR, f"{key}.json")
+
+
+def read_cached(url: str) -> tuple[str | None, dict]:
+    html_path, meta_path = cache_paths(url)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        with open(html_path, encoding="utf-8") as f:
+            return f.read(), meta
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None, {}
+
+
+def write_cached(url: str, html: str, headers: httpx.Headers):
+    os.makedirs(HTML_CACHE_DIR, exist_ok=True)
+    html_path, meta_path = cache_paths(url)
+    meta = {
+        "url": url,
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+        "fetched_at": time.time()
+    }
+    # write-then-rename so a concurrent reader never sees a partial file; the
+    # temp name is unique per call, as threads may fetch the same URL at once
+    for path, content in ((html_path, html), (meta_path, json.dumps(meta))):
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=HTML_CACHE_DIR, suffix=".tmp", delete=False) as f:
+            f.write(content)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.remove(f.name)
+            raise
+
+
+def fetch_static(url: str) -> tuple[str | None, str]:
+    """
+    Plain HTTP GET with an on-disk HTML cache. Sends If-None-Match /
+    If-Modified-Since when a cached copy exists.
+    Returns (html, tier) where tier is "static" or "static-cache" (304),
+    or (None, "static") if the page is not HTML or the fetch failed.
+    """
+    cached_html, meta = read_cached(url)
+    headers = {}
+    if cached_html is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        res = http_client.get(url, headers=headers)
+    except httpx.HTTPError as e:
+        print(f"[DEBUG] Static fetch failed for {url}: {e}")
+        return None, "static"
+
+    if res.status_code == 304 and cached_html is not None:
+        print(f"[DEBUG] Static fetch: {url} not modified, using cached HTML")
+        return cached_html, "static-cache"
+
+    if res.status_code >= 400 or "html" not in res.headers.get("content-type", ""):
+        print(f"[DEBUG] Static fetch for {url} unusable: {res.status_code} {res.headers.get('content-type')}")
+        return None, "static"
+
+    html = res.text
+    write_cached(url, html, res.headers)
+    return html, "static"
@@ -1,29 +1,220 @@
-from app.ingestion.chunker import chunk_text
-from app.ingestion.embedder import embed
-from app.vectorstore.chroma import collection
+import hashlib
+import time
+from collections import Counter
 
+from app.config import EMBED_BATCH_SIZE, EMBED_BATCH_MAX_TOKENS, EMBED_CONCURRENCY, PIPELINE_QUEUE_SIZE, DEDUP_ENABLED
+from app.ingestion.chunker import ChunkPacker
+from app.ingestion.dedup import BoilerplateFilter, NearDuplicateIndex
+from app.ingestion.embedder import embed_batch, cache
+from app.ingestion.pipeline import Stage, run_pipeline
+from app.vectorstore.router import router, Shard
+from app.vectorstore.registry import registry
+from app.vectorstore.lexical import LexicalIndex, lexical_store
+from app.rag.cache import generation_cache
 
-def index_document(document_id: str, sections: list[dict]):
+
+def chunk_id(document_id: str, text: str, occurrence: int = 0) -> str:
+    # Content-addressed, so an unchanged chunk keeps its id across re-indexing
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:20]
+    return f"{document_id}_{digest}" if not occurrence else f"{document_id}_{digest}_{occurrence}"
+
+
+def stored_chunks(shard: Shard | None) -> dict[str, dict]:
     """
-    Takes extracted document sections,
-    chunks them, embeds them,
-    and stores them in the vector database.
+    chunk id -> metadata for everything stored for the shard's document.
+    """
+    if shard is None:
+        return {}
+    res = shard.collection.get(where=shard.where(), include=["metadatas"])
+    return dict(zip(res["ids"], res["metadatas"]))
+
+
+class ChunkBatcher:
     """
-    idx = 0
+    Chunks incoming sections (packing across section boundaries) and groups
+    the chunk records into batches bounded by both EMBED_BATCH_SIZE (items)
+    and EMBED_BATCH_MAX_TOKENS. With a `dedup` index, chunks that are
+    near-duplicates of an earlier chunk are skipped before they get an id
+    or position.
+
+    Records whose id is in `existing` are already stored (same content):
+    they are marked "stored" and don't count toward the token bound, since
+    they are not embedded again.
+    """
+
+    def __init__(self, document_id: str, dedup: NearDuplicateIndex | None = None, existing=()):
+        self.document_id = document_id
+        self.packer = ChunkPacker()
+        self.dedup = dedup
+        self.existing = existing
+        self.occurrences = Counter()
+        self.count = 0
+        self.skipped = 0
+        self.skipped_tokens = 0
+        self.batch = []
+        self.batch_tokens = 0
 
-    for section in sections:
-        chunks = chunk_text(section["text"])
+    def add_section(self, section: dict):
+        yield from self.add_chunks(self.packer.add(section))
 
+    def flush(self):
+        yield from self.add_chunks(self.packer.flush())
+        if self.batch:
+            yield self.take()
+
+    def add_chunks(self, chunks):
         for chunk in chunks:
-            print(f"[DEBUG] Indexing chunk {idx} for doc {document_id}. Size: {len(chunk)} chars")
-            collection.add(
-                ids=[f"{document_id}_{idx}"],
-                documents=[chunk],
-                metadatas=[{
-                    "document_id": document_id,
-                    "source": section["source"]
-                }],
-                embeddings=[embed(chunk)]
-            )
-            idx += 1
-    print(f"[DEBUG] Finished indexing {idx} chunks for {document_id}")
+            if self.dedup is not None and self.dedup.seen_before(chunk["text"]):
+                self.skipped += 1
+                self.skipped_tokens += chunk["tokens"]
+                continue
+            text = chunk["text"]
+            record_id = chunk_id(self.document_id, text, self.occurrences[text])
+            self.occurrences[text] += 1
+            stored = record_id in self.existing
+            tokens = 0 if stored else chunk["tokens"]
+
+            if self.batch and (len(self.batch) >= EMBED_BATCH_SIZE or self.batch_tokens + tokens > EMBED_BATCH_MAX_TOKENS):
+                yield self.take()
+            self.batch.append({
+                "id": record_id,
+                "text": chunk["text"],
+                "stored": stored,
+                "metadata": {
+                    "document_id": self.document_id,
+                    "source": chunk["source"],
+                    "position": self.count
+                }
+            })
+            self.batch_tokens += tokens
+            self.count += 1
+
+    def take(self) -> list[dict]:
+        batch = self.batch
+        self.batch = []
+        self.batch_tokens = 0
+        return batch
+
+
+def embed_stage(batch: list[dict]):
+    # only chunks not already stored are embedded
+    texts = [r["text"] for r in batch if not r["stored"]]
+    yield batch, embed_batch(texts) if texts else []
+
+
+def store_batch(collection, batch: list[dict], embeddings: list[list[float]], existing: dict[str, dict]):
+    """
+    Adds new chunks and updates the metadata of stored chunks that moved
+    (e.g. a slide was inserted before them). Unchanged chunks are left alone.
+    """
+    new = [r for r in batch if not r["stored"]]
+    if new:
+        collection.add(
+            ids=[r["id"] for r in new],
+            documents=[r["text"] for r in new],
+            metadatas=[r["metadata"] for r in new],
+            embeddings=embeddings
+        )
+    moved = [r for r in batch if r["stored"] and existing.get(r["id"]) != r["metadata"]]
+    if moved:
+        collection.update(ids=[r["id"] for r in moved], metadatas=[r["metadata"] for r in moved])
+
+
+def delete_chunks(collection, ids: list[str]):
+    step = router.client.get_max_batch_size()
+    for i in range(0, len(ids), step):
+        collection.delete(ids=ids[i:i + step])
+
+
+def index_document(document_id: str, sections, progress=None):
+    """
+    Takes extracted document sections (any iterable, consumed lazily),
+    chunks them, embeds them in batches,
+    and stores them in the vector database.
+
+    Re-indexing is incremental: chunk ids are content hashes, so only
+    chunks not already stored for the document are embedded and added,
+    chunks no longer present are deleted in bulk afterwards, and the
+    lexical index is updated in place.
+
+    Extraction, chunking, embedding and writes overlap: each runs on its
+    own thread(s) connected by bounded queues. Writes to the collection
+    happen on the calling thread.
+
+    `progress`, if given, is called with chunks_indexed=<total so far>
+    after every write, and with the dedup counts (chunks_skipped,
+    tokens_skipped, lines_stripped) once indexing finishes, and with
+    chunks_embedded / chunks_removed for the incremental diff.
+
+    Returns {"added", "unchanged", "removed"} chunk counts.
+    """
+    started = time.perf_counter()
+    shard = router.shard(document_id)
+    existing = stored_chunks(shard)
+    boilerplate = BoilerplateFilter() if DEDUP_ENABLED else None
+    batcher = ChunkBatcher(document_id, NearDuplicateIndex() if DEDUP_ENABLED else None, existing)
+    current = lexical_store.get(document_id)
+    lexical = current.copy() if current is not None else LexicalIndex()
+    kept = set()
+    stored = 0
+    added = 0
+    text_bytes = 0
+
+    def write(item):
+        nonlocal stored, added, text_bytes
+        batch, embeddings = item
+        store_batch(shard.collection, batch, embeddings, existing)
+        for r in batch:
+            kept.add(r["id"])
+            text_bytes += len(r["text"].encode("utf-8"))
+            if r["id"] not in lexical.lengths:
+                lexical.add(r["id"], r["text"])
+        stored += len(batch)
+        added += len(embeddings)
+        print(f"[DEBUG] Indexed {stored} chunks so far for doc {document_id} ({added} new)")
+        if progress is not None:
+            progress(chunks_indexed=stored, chunks_embedded=added)
+
+    if boilerplate is not None:
+        sections = boilerplate.filter(sections)
+
+    run_pipeline(
+        sections,
+        [
+            Stage("chunk", batcher.add_section, flush=batcher.flush),
+            Stage("embed", embed_stage, workers=EMBED_CONCURRENCY),
+        ],
+        sink=write,
+        queue_size=PIPELINE_QUEUE_SIZE
+    )
+
+    removed = [chunk for chunk in existing if chunk not in kept]
+    delete_chunks(shard.collection, removed)
+    # copies from before sharding, now superseded by the shard
+    router.retire_legacy(document_id)
+    # ids left over from an earlier index without a vector (or vice versa)
+    lexical.remove_many([chunk for chunk in lexical.lengths if chunk not in kept])
+
+    lexical_store.save(document_id, lexical)
+    registry.record_indexed(document_id, stored, text_bytes)
+    if added or removed:
+        generation_cache.invalidate_document(document_id)
+    print(f"[DEBUG] Re-index diff for {document_id}: {added} added, {stored - added} unchanged, {len(removed)} removed")
+    if progress is not None:
+        progress(chunks_removed=len(removed))
+
+    lines_stripped = boilerplate.lines_stripped if boilerplate is not None else 0
+    if DEDUP_ENABLED:
+        print(
+            f"[DEBUG] Dedup for {document_id}: skipped {batcher.skipped} near-duplicate chunks "
+            f"(~{batcher.skipped_tokens} tokens), stripped {lines_stripped} boilerplate lines"
+        )
+    if progress is not None:
+        progress(chunks_skipped=batcher.skipped, tokens_skipped=batcher.skipped_tokens, lines_stripped=lines_stripped)
+
+    elapsed = time.perf_counter() - started
+    rate = stored / elapsed if elapsed > 0 else 0.0
+    print(f"[DEBUG] Finished indexing {stored} chunks for {document_id} in {elapsed:.2f}s ({rate:.1f} chunks/sec)")
+    if cache is not None:
+        print(f"[DEBUG] Embedding cache: {cache.snapshot()}")
+    return {"added": added, "unchanged": stored - added, "removed": len(removed)}
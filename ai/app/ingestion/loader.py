@@ -1,32 +1,77 @@
-import pdfplumber
 from pptx import Presentation
 import logging
-from playwright.sync_api import sync_playwright
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import trafilatura
 
+from app.config import PDF_ENGINE, PDF_WORKERS, PDF_PAGES_PER_TASK, PDF_PARALLEL_MIN_PAGES
+from app.ingestion.pdf_extract import extract_pages, page_count
+from app.ingestion.browser import browser_pool
+from app.ingestion.fetcher import fetch_static
+
 logger = logging.getLogger(__name__)
 
 import os
 
-def load_pdf(path: str):
-    pages = []
-    filename = os.path.basename(path)
-    with pdfplumber.open(path) as pdf:
-        for i, page in enumerate(pdf.pages):
-            # x_tolerance=1 helps prevent "C H A P T E R" issues by grouping closer characters
-            text = page.extract_text(x_tolerance=1)
-            if text:
-                pages.append({
+_pdf_pool = None
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        # spawn keeps workers independent of the server's threads and clients
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pdf_pool
+
+
+def extract_page_ranges(path: str):
+    """
+    Yields extracted (page_index, text) lists in page order, one per range.
+    Large PDFs are extracted on the process pool with a bounded number of
+    ranges in flight, so results never pile up ahead of the consumer.
+    """
+    total = page_count(path)
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, total)) for start in range(0, total, PDF_PAGES_PER_TASK)]
+
+    if total < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS <= 1:
+        for start, end in ranges:
+            yield extract_pages(path, start, end, PDF_ENGINE)
+        return
+
+    pool = get_pdf_pool()
+    in_flight = deque()
+    for start, end in ranges:
+        in_flight.append(pool.submit(extract_pages, path, start, end, PDF_ENGINE))
+        if len(in_flight) >= PDF_WORKERS * 2:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def iter_pdf(path: str, display_name: str | None = None):
+    """
+    Yields one section per non-empty page, in page order.
+    """
+    filename = os.path.basename(display_name or path)
+
+    for extracted in extract_page_ranges(path):
+        for i, text in extracted:
+            if text and text.strip():
+                yield {
                     "source": f"{filename} (Page {i+1})",
                     "text": text
-                })
-    return pages
+                }
 
 
-def load_ppt(path: str):
+def iter_ppt(path: str, display_name: str | None = None):
+    """
+    Yields one section per slide that has text.
+    """
     prs = Presentation(path)
-    slides = []
-    filename = os.path.basename(path)
+    filename = os.path.basename(display_name or path)
 
     for i, slide in enumerate(prs.slides):
         content = []
@@ -35,102 +80,126 @@ def load_ppt(path: str):
                 content.append(shape.text)
 
         if content:
-            slides.append({
+            yield {
                 "source": f"{filename} (Slide {i+1})",
                 "text": " ".join(content)
-            })
+            }
 
-    return slides
 
-def load_website(url: str):
+def load_pdf(path: str, display_name: str | None = None):
+    return list(iter_pdf(path, display_name))
+
+
+def load_ppt(path: str, display_name: str | None = None):
+    return list(iter_ppt(path, display_name))
+
+MIN_TEXT_LENGTH = 200
+BLOCK_PHRASES = ["please verify you are a human", "access denied", "captcha"]
+
+
+def extract_text(html_content: str) -> str:
     """
-    Scrapes a website using Playwright for rendering and Trafilatura for extraction.
-    Falls back to BeautifulSoup if Trafilatura fails.
+    Extracts main text with Trafilatura, falling back to BeautifulSoup.
+    Returns "" when neither yields enough text.
     """
     from bs4 import BeautifulSoup
+
+    text = trafilatura.extract(html_content, include_comments=False, include_tables=True)
+
+    if text and len(text) > MIN_TEXT_LENGTH:
+        print(f"[DEBUG] Trafilatura success. extracted {len(text)} chars.")
+        print(f"[DEBUG] Snippet: {text[:500]}...")
+        return text
+
+    print("[DEBUG] Trafilatura failed or too short. Falling back to BeautifulSoup.")
+
+    soup = BeautifulSoup(html_content, "html.parser")
+
+    for script in soup(["script", "style", "nav", "footer", "header", "aside"]):
+        script.decompose()
+
+    target_tags = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'article', 'section']
+    chunks = []
+    for element in soup.find_all(target_tags):
+        content = element.get_text(strip=True)
+        if len(content) > 20:
+            chunks.append(content)
+
+    fallback_text = "\n\n".join(chunks)
+    if fallback_text and len(fallback_text) > MIN_TEXT_LENGTH:
+        return fallback_text
+
+    print("[DEBUG] BeautifulSoup extraction too short.")
+    return ""
+
+
+def blocked_reason(text: str) -> str | None:
+    """
+    Returns why extracted text looks like a bot block / JS gate, or None.
+    """
+    lowered = text.lower()
+    found = [p for p in BLOCK_PHRASES if p in lowered]
+    if found:
+        return f"bot block/captcha phrases {found}"
+
+    # "Enable javascript" is common in footnotes/noscript tags of valid sites. Only block if text is short.
+    if "enable javascript" in lowered and len(text) < 1000:
+        return "'enable javascript' in short text"
+
+    return None
+
+
+def render_and_extract(url: str) -> str:
     import time
-    
-    logger.info(f"Scraping URL: {url}")
-    print(f"[DEBUG] Starting scrape for: {url}")
-    
+
     MAX_RETRIES = 3
-    final_text = ""
-    
+
     for attempt in range(MAX_RETRIES):
         try:
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=True)
-                context = browser.new_context(
-                    user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                )
-                page = context.new_page()
-                
-                try:
-                    page.goto(url, wait_until="domcontentloaded", timeout=45000) 
-                    page.wait_for_load_state("domcontentloaded")
-                    page.wait_for_timeout(2000) 
-                except Exception as e:
-                    print(f"[DEBUG] Page load timeout/error (attempt {attempt+1}/{MAX_RETRIES}): {e}")
-                    if attempt < MAX_RETRIES - 1:
-                        time.sleep(2)
-                        continue
-
-                html_content = page.content()
-                browser.close()
-
-                print(f"[DEBUG] Raw HTML captured. Length: {len(html_content)}")
-                text = trafilatura.extract(html_content, include_comments=False, include_tables=True)
-                
-                if text and len(text) > 200:
-                    print(f"[DEBUG] Trafilatura success. extracted {len(text)} chars.")
-                    print(f"[DEBUG] Snippet: {text[:500]}...")
-                    final_text = text
-                    break
-                
-                print("[DEBUG] Trafilatura failed or too short. Falling back to BeautifulSoup.")
-
-                soup = BeautifulSoup(html_content, "html.parser")
-                
-                for script in soup(["script", "style", "nav", "footer", "header", "aside"]):
-                    script.decompose()
-
-
-                target_tags = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'article', 'section']
-                chunks = []
-                for element in soup.find_all(target_tags):
-                    content = element.get_text(strip=True)
-                    if len(content) > 20: 
-                        chunks.append(content)
-                
-                fallback_text = "\n\n".join(chunks)
-                if fallback_text and len(fallback_text) > 200:
-                     final_text = fallback_text
-                     break
-                
-                print(f"[DEBUG] BeautifulSoup extraction too short. Retrying... ({attempt+1})")
-                
+            html_content = browser_pool.render(url)
+            print(f"[DEBUG] Raw HTML captured. Length: {len(html_content)}")
+
+            text = extract_text(html_content)
+            if text:
+                return text
+
+            print(f"[DEBUG] Rendered extraction too short. Retrying... ({attempt+1})")
+
         except Exception as e:
             print(f"[DEBUG] scraping error (attempt {attempt+1}): {e}")
             if attempt < MAX_RETRIES - 1:
                 time.sleep(2)
 
+    return ""
+
+
+def load_website(url: str):
+    """
+    Scrapes a website in tiers: a plain (cached, conditional) HTTP fetch
+    first, and the pooled Playwright browser only when the static text is
+    too short or looks JS-gated. Sections carry the serving tier in
+    "fetch_tier" ("static", "static-cache" or "browser").
+    """
+    logger.info(f"Scraping URL: {url}")
+    print(f"[DEBUG] Starting scrape for: {url}")
+
+    html_content, tier = fetch_static(url)
+    final_text = extract_text(html_content) if html_content else ""
+
+    reason = blocked_reason(final_text) if final_text else "no static text"
+    if reason:
+        print(f"[DEBUG] Static tier insufficient for {url} ({reason}). Escalating to browser.")
+        tier = "browser"
+        final_text = render_and_extract(url)
 
-    if not final_text or len(final_text) < 200:
+    if not final_text or len(final_text) < MIN_TEXT_LENGTH:
         print(f"[DEBUG] Failed to extract meaningful content from {url}. Final text length: {len(final_text) if final_text else 0}")
-        return [] 
-    
-
-    block_phrases = ["please verify you are a human", "access denied", "captcha"]
-    if any(phrase in final_text.lower() for phrase in block_phrases):
-         print(f"[DEBUG] Detected bot block/captcha. Phrases found: {[p for p in block_phrases if p in final_text.lower()]}")
-         return []
-         
-    # "Enable javascript" is common in footnotes/noscript tags of valid sites. Only block if text is short.
-    if "enable javascript" in final_text.lower() and len(final_text) < 1000:
-        print("[DEBUG] Detected 'enable javascript' in short text. Treating as bot block.")
         return []
 
-    return [{"source": url, "text": final_text}]
-            
-
+    reason = blocked_reason(final_text)
+    if reason:
+        print(f"[DEBUG] Detected {reason}. Treating as bot block.")
+        return []
 
+    print(f"[DEBUG] {url} served by tier: {tier}")
+    return [{"source": url, "text": final_text, "fetch_tier": tier}]
@@ -0,0 +1,75 @@
+# Page-level PDF text extraction, run inside process-pool workers.
+# Keep this module free of heavy app imports so workers start quickly.
+import pdfplumber
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # optional dependency
+    pdfium = None
+
+
+def page_count(path: str) -> int:
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def looks_letter_spaced(text: str) -> bool:
+    # "C H A P T E R" style output: most tokens are single characters
+    tokens = text.split()
+    if len(tokens) < 20:
+        return False
+    singles = sum(1 for t in tokens if len(t) == 1 and t.isalpha())
+    return singles / len(tokens) > 0.5
+
+
+def extract_with_pdfplumber(path: str, start: int, end: int) -> list[tuple[int, str]]:
+    results = []
+    with pdfplumber.open(path) as pdf:
+        for i in range(start, end):
+            # x_tolerance=1 helps prevent "C H A P T E R" issues by grouping closer characters
+            results.append((i, pdf.pages[i].extract_text(x_tolerance=1) or ""))
+    return results
+
+
+def extract_with_pdfium(path: str, start: int, end: int) -> list[tuple[int, str]]:
+    results = []
+    fallback = []
+    pdf = pdfium.PdfDocument(path)
+    try:
+        for i in range(start, end):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range().replace("\r\n", "\n")
+            finally:
+                textpage.close()
+                page.close()
+            if looks_letter_spaced(text):
+                fallback.append(i)
+            results.append((i, text))
+    finally:
+        pdf.close()
+
+    if fallback:
+        redone = {}
+        with pdfplumber.open(path) as plumber:
+            for i in fallback:
+                redone[i] = plumber.pages[i].extract_text(x_tolerance=1) or ""
+        results = [(i, redone.get(i, text)) for i, text in results]
+
+    return results
+
+
+def extract_pages(path: str, start: int, end: int, engine: str) -> list[tuple[int, str]]:
+    """
+    Extracts pages [start, end) and returns (page_index, text) pairs.
+    """
+    if engine == "pdfium" and pdfium is not None:
+        return extract_with_pdfium(path, start, end)
+    return extract_with_pdfplumber(path, start, end)
@@ -0,0 +1,122 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a pipeline. `fn` takes an item and returns an iterable of
+    items for the next stage (so a stage can drop, pass through, or fan out).
+    `flush`, if given, is called once after the last input and may return
+    trailing items. Stages with a flush must run with a single worker.
+    """
+
+    def __init__(self, name: str, fn, workers: int = 1, flush=None):
+        if flush is not None and workers != 1:
+            raise ValueError(f"Stage {name} has a flush step and must use one worker")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.flush = flush
+
+
+def run_pipeline(source, stages: list[Stage], sink, queue_size: int):
+    """
+    Runs `source` -> stages -> `sink` with each stage on its own thread(s),
+    connected by bounded queues so a slow stage applies backpressure instead
+    of letting work pile up in memory.
+
+    The source iterable is consumed on a feeder thread; `sink` is called on
+    the calling thread for every item leaving the last stage. The first
+    exception raised anywhere stops the pipeline and is re-raised here.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    stop = threading.Event()
+    errors = []
+
+    def put(q, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fail(e: Exception):
+        errors.append(e)
+        stop.set()
+
+    def feed():
+        try:
+            for item in source:
+                if not put(queues[0], item):
+                    return
+            put(queues[0], _DONE)
+        except Exception as e:
+            fail(e)
+
+    def work(stage: Stage, inbox, outbox, remaining: list, lock: threading.Lock):
+        try:
+            while True:
+                item = get(inbox)
+                if item is _DONE:
+                    # let sibling workers see the end marker too
+                    put(inbox, _DONE)
+                    break
+                for out in stage.fn(item):
+                    if not put(outbox, out):
+                        return
+
+            if stop.is_set():
+                return
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                if stage.flush is not None:
+                    for out in stage.flush():
+                        if not put(outbox, out):
+                            return
+                put(outbox, _DONE)
+        except Exception as e:
+            fail(e)
+
+    threads = [threading.Thread(target=feed, name="pipeline-source", daemon=True)]
+    for i, stage in enumerate(stages):
+        remaining = [stage.workers]
+        lock = threading.Lock()
+        for w in range(stage.workers):
+            threads.append(threading.Thread(
+                target=work,
+                args=(stage, queues[i], queues[i + 1], remaining, lock),
+                name=f"pipeline-{stage.name}-{w}",
+                daemon=True
+            ))
+
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            item = get(queues[-1])
+            if item is _DONE:
+                break
+            sink(item)
+    except Exception as e:
+        fail(e)
+    finally:
+        for t in threads:
+            t.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,56 @@
+import hashlib
+import os
+import tempfile
+
+from app.config import UPLOAD_DIR, UPLOAD_CHUNK_SIZE
+from app.ingestion.loader import iter_pdf, iter_ppt
+
+SUPPORTED_EXTENSIONS = {".pdf", ".pptx"}
+
+
+def upload_extension(filename: str | None) -> str:
+    return os.path.splitext(filename or "")[1].lower()
+
+
+def spool_upload(src, filename: str) -> tuple[str, str]:
+    """
+    Copies an uploaded file object to a uniquely named temp file in
+    fixed-size chunks, hashing the content on the way through.
+    Returns (path, sha256 hex digest). The caller owns the file.
+    """
+    sha = hashlib.sha256()
+    fd, path = tempfile.mkstemp(suffix=upload_extension(filename), dir=UPLOAD_DIR)
+
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                out.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return path, sha.hexdigest()
+
+
+def iter_file(path: str, filename: str):
+    """
+    Returns a lazy section iterator for the upload's file type.
+    `filename` is the client-supplied name, used for section sources.
+    """
+    ext = upload_extension(filename)
+    if ext == ".pdf":
+        return iter_pdf(path, display_name=filename)
+    if ext == ".pptx":
+        return iter_ppt(path, display_name=filename)
+    raise ValueError(f"Unsupported file type: {ext}")
+
+
+def remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,353 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import SQLITE_BUSY_TIMEOUT, JOB_STALE_SECONDS
+from app.vectorstore.chroma import DB_DIR
+from app.vectorstore.registry import registry
+
+ACTIVE_STATES = ("queued", "running")
+JOBS_PATH = os.path.join(DB_DIR, "jobs.sqlite3")
+# Page progress is written to the job store every this many pages
+PERSIST_EVERY_PAGES = 10
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobConflict(Exception):
+    pass
+
+
+class IngestJob:
+    """
+    Status of one ingestion run. Updated from worker threads, read by
+    GET /jobs/{id}. With a `store`, every update is also written there so
+    other worker processes can read it.
+    """
+
+    def __init__(self, document_id: str, kind: str, fingerprint: str, store=None):
+        self.job_id = str(uuid.uuid4())
+        self.document_id = document_id
+        self.kind = kind
+        self.fingerprint = fingerprint
+        self.status = "queued"
+        self.stage = "queued"
+        self.pages_processed = 0
+        self.chunks_indexed = 0
+        self.chunks_embedded = 0
+        self.chunks_removed = 0
+        self.chunks_skipped = 0
+        self.tokens_skipped = 0
+        self.lines_stripped = 0
+        self.fetch_tier = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.store = store
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, data: dict, fingerprint: str) -> "IngestJob":
+        # read-only view of a job owned by another process
+        job = cls(data["document_id"], data["kind"], fingerprint)
+        for key, value in data.items():
+            setattr(job, key, value)
+        return job
+
+    def update(self, **fields):
+        with self.lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self.updated_at = time.time()
+        self.persist()
+
+    def persist(self):
+        if self.store is not None:
+            self.store.save(self)
+
+    def track_sections(self, sections):
+        """
+        Wraps a section iterator so every section pulled counts as a processed page.
+        """
+        for section in sections:
+            with self.lock:
+                self.pages_processed += 1
+                self.updated_at = time.time()
+                due = self.pages_processed % PERSIST_EVERY_PAGES == 0
+            if due:
+                self.persist()
+            yield section
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "job_id": self.job_id,
+                "document_id": self.document_id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.stage,
+                "pages_processed": self.pages_processed,
+                "chunks_indexed": self.chunks_indexed,
+                "chunks_embedded": self.chunks_embedded,
+                "chunks_removed": self.chunks_removed,
+                "chunks_skipped": self.chunks_skipped,
+                "tokens_skipped": self.tokens_skipped,
+                "lines_stripped": self.lines_stripped,
+                "fetch_tier": self.fetch_tier,
+                "error": self.error,
+                "created_at": self.created_at,
+                "updated_at": self.updated_at,
+            }
+
+
+class JobStore:
+    """
+    Job rows in SQLite next to the vector store, shared by all worker
+    processes: any worker can answer GET /jobs/{id}, and submissions are
+    idempotent per document across workers. The process owning a queued
+    or running row keeps its updated_at column fresh (see touch()), so a
+    row not refreshed for `stale_after` seconds belongs to a dead worker
+    and is treated as failed, however long the job has been waiting.
+    """
+
+    def __init__(self, path: str, stale_after: float = JOB_STALE_SECONDS, history: int = 1000):
+        self.stale_after = stale_after
+        self.history = history
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_document ON jobs (document_id, created_at)")
+        # tombstones of documents being deleted; claim() refuses them
+        self.db.execute("CREATE TABLE IF NOT EXISTS deletions (document_id TEXT PRIMARY KEY, started_at REAL NOT NULL)")
+        self.db.commit()
+
+    def save(self, job: IngestJob):
+        data = job.to_dict()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, document_id, fingerprint, status, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (data["job_id"], data["document_id"], job.fingerprint, data["status"], json.dumps(data), data["created_at"], time.time())
+            )
+            self.db.commit()
+
+    def touch(self, job_ids: list[str]):
+        """
+        Marks the jobs as still owned by a live process.
+        """
+        with self.lock:
+            self.db.executemany("UPDATE jobs SET updated_at = ? WHERE job_id = ?", [(time.time(), jid) for jid in job_ids])
+            self.db.commit()
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self.lock:
+            row = self.db.execute("SELECT data, fingerprint, updated_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._load(row)
+
+    def latest(self, document_id: str) -> IngestJob | None:
+        with self.lock:
+            return self._latest(document_id)
+
+    def begin_delete(self, document_id: str):
+        """
+        Writes a tombstone for the document, so no job is started for it
+        until end_delete(). Raises JobConflict if a job is active. A
+        tombstone older than `stale_after` belongs to a dead worker and is
+        ignored.
+        """
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._latest(document_id)
+                if existing is not None and existing.status in ACTIVE_STATES:
+                    raise JobConflict(f"Document {document_id} is being ingested")
+                if self._deleting(document_id):
+                    raise JobConflict(f"Document {document_id} is being deleted")
+                self.db.execute(
+                    "INSERT OR REPLACE INTO deletions (document_id, started_at) VALUES (?, ?)",
+                    (document_id, time.time())
+                )
+            finally:
+                self.db.commit()
+
+    def end_delete(self, document_id: str):
+        with self.lock:
+            self.db.execute("DELETE FROM deletions WHERE document_id = ?", (document_id,))
+            self.db.commit()
+
+    def claim(self, job: IngestJob, reuse_done: bool, full: bool = False) -> IngestJob | None:
+        """
+        Records `job` unless the document's latest job is active with the
+        same fingerprint (or done, with reuse_done, and the document is still
+        indexed); that job is returned instead. Raises JobConflict if it is
+        active with another fingerprint or the document is being deleted,
+        and JobQueueFull if a new job is needed but the caller is `full`.
+        """
+        with self.lock:
+            # one writer at a time across processes, so two workers can't
+            # both start a job for the document
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                if self._deleting(job.document_id):
+                    raise JobConflict(f"Document {job.document_id} is being deleted")
+                existing = self._latest(job.document_id)
+                if existing is not None:
+                    if existing.status in ACTIVE_STATES:
+                        if existing.fingerprint == job.fingerprint:
+                            return existing
+                        raise JobConflict(f"Document {job.document_id} is already being ingested")
+                    if (reuse_done and existing.status == "done" and existing.fingerprint == job.fingerprint
+                            and registry.get(job.document_id) is not None):
+                        # a deleted (or expired) document is indexed again
+                        return existing
+                if full:
+                    raise JobQueueFull("Too many ingestion jobs in progress")
+                data = job.to_dict()
+                self.db.execute(
+                    "INSERT INTO jobs (job_id, document_id, fingerprint, status, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (data["job_id"], data["document_id"], job.fingerprint, data["status"], json.dumps(data), data["created_at"], data["updated_at"])
+                )
+                self.db.execute(
+                    """
+                    DELETE FROM jobs WHERE job_id IN (
+                        SELECT job_id FROM jobs WHERE status NOT IN ('queued', 'running')
+                        ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.history,)
+                )
+            finally:
+                self.db.commit()
+        return None
+
+    def _deleting(self, document_id: str) -> bool:
+        row = self.db.execute("SELECT started_at FROM deletions WHERE document_id = ?", (document_id,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.stale_after
+
+    def _latest(self, document_id: str) -> IngestJob | None:
+        row = self.db.execute(
+            "SELECT data, fingerprint, updated_at FROM jobs WHERE document_id = ? ORDER BY created_at DESC LIMIT 1",
+            (document_id,)
+        ).fetchone()
+        return self._load(row)
+
+    def _load(self, row) -> IngestJob | None:
+        if row is None:
+            return None
+        job = IngestJob.from_dict(json.loads(row[0]), row[1])
+        # row[2] is the owner's heartbeat, not the job's last progress
+        if job.status in ACTIVE_STATES and time.time() - row[2] > self.stale_after:
+            job.status = job.stage = "failed"
+            job.error = "Worker stopped before the job finished"
+        return job
+
+
+class JobManager:
+    """
+    Runs ingestion jobs on a bounded worker pool.
+
+    - At most `max_active` jobs may be queued or running at once in this
+      process; beyond that submit() raises JobQueueFull.
+    - Submissions are idempotent per document_id (across processes sharing
+      `store`): while a job for a document is active, submitting the same
+      fingerprint (content hash / URL) returns the existing job, and with
+      reuse_done so does a finished successful one. A different
+      fingerprint while one is active raises JobConflict.
+    - A heartbeat thread refreshes this process's queued and running rows
+      in `store` every stale_after / 3 seconds, so other workers don't
+      take a job waiting in the queue for a dead one.
+    """
+
+    def __init__(self, workers: int, max_active: int, store: JobStore, history: int = 1000):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        self.max_active = max_active
+        self.store = store
+        self.history = history
+        self.jobs = OrderedDict()  # jobs run by this process
+        self.lock = threading.Lock()
+        self.heartbeat = None
+
+    def submit(self, document_id: str, kind: str, fingerprint: str, fn, reuse_done: bool = True) -> tuple[IngestJob, bool]:
+        """
+        Schedules fn(job). Returns (job, created); created is False when an
+        existing job was returned instead.
+        """
+        with self.lock:
+            active = sum(1 for j in self.jobs.values() if j.status in ACTIVE_STATES)
+            job = IngestJob(document_id, kind, fingerprint, store=self.store)
+            existing = self.store.claim(job, reuse_done, full=active >= self.max_active)
+            if existing is not None:
+                return self.jobs.get(existing.job_id, existing), False
+
+            self.jobs[job.job_id] = job
+            self._prune()
+            if self.heartbeat is None:
+                self.heartbeat = threading.Thread(target=self._heartbeat, name="ingest-job-heartbeat", daemon=True)
+                self.heartbeat.start()
+
+        self.executor.submit(self._run, job, fn)
+        return job, True
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return job if job is not None else self.store.get(job_id)
+
+    def active(self, document_id: str) -> bool:
+        job = self.store.latest(document_id)
+        return job is not None and job.status in ACTIVE_STATES
+
+    def begin_delete(self, document_id: str):
+        # see JobStore.begin_delete
+        self.store.begin_delete(document_id)
+
+    def end_delete(self, document_id: str):
+        self.store.end_delete(document_id)
+
+    def _run(self, job: IngestJob, fn):
+        job.update(status="running", stage="starting")
+        try:
+            fn(job)
+            job.update(status="done", stage="done")
+        except Exception as e:
+            traceback.print_exc()
+            job.update(status="failed", stage="failed", error=str(e))
+        print(f"[DEBUG] Job {job.job_id} ({job.kind} {job.document_id}) finished: {job.status}")
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.store.stale_after / 3)
+            with self.lock:
+                active = [jid for jid, j in self.jobs.items() if j.status in ACTIVE_STATES]
+            if not active:
+                continue
+            try:
+                self.store.touch(active)
+            except Exception as e:
+                print(f"[WARN] Job heartbeat failed: {e}")
+
+    def _prune(self):
+        # drop the oldest finished jobs once history is full
+        finished = [jid for jid, j in self.jobs.items() if j.status not in ACTIVE_STATES]
+        for jid in finished[:max(0, len(self.jobs) - self.history)]:
+            self.jobs.pop(jid)
@@ -0,0 +1,216 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from app.config import (
+    EMBEDDING_DIMENSIONS,
+    DOCUMENT_DEFAULT_TTL,
+    LIFECYCLE_SWEEP_INTERVAL,
+    COMPACT_MIN_DELETED_CHUNKS,
+    SQLITE_BUSY_TIMEOUT,
+)
+from app.ingestion.indexer import stored_chunks
+from app.jobs import JobConflict
+from app.rag.bank import question_bank, BANK_PATH
+from app.rag.cache import generation_cache
+from app.vectorstore.chroma import DB_DIR, remote
+from app.vectorstore.lexical import lexical_store
+from app.vectorstore.registry import registry, REGISTRY_PATH
+from app.vectorstore.router import router
+
+CHROMA_SQLITE_PATH = os.path.join(DB_DIR, "chroma.sqlite3")
+# float32 vectors
+VECTOR_BYTES = EMBEDDING_DIMENSIONS * 4
+
+
+def expiry(ttl_seconds: int | None) -> float | None:
+    ttl = ttl_seconds if ttl_seconds is not None else DOCUMENT_DEFAULT_TTL
+    return time.time() + ttl if ttl > 0 else None
+
+
+def delete_document(document_id: str) -> int | None:
+    """
+    Removes a document everywhere it is kept: its chunks (its whole
+    collection when sharding per document, else one bulk delete), lexical
+    index, banked questions, cached generations and registry row.
+    Returns the number of chunks deleted, or None for an unknown document.
+    """
+    row = registry.get(document_id)
+    chunks = row["chunk_count"] if row is not None else len(stored_chunks(router.find(document_id)))
+    if row is None and not chunks:
+        return None
+
+    router.drop(document_id)
+    lexical_store.delete(document_id)
+    question_bank.clear(document_id)
+    generation_cache.invalidate_document(document_id)
+    registry.forget(document_id)
+    print(f"[DEBUG] Deleted document {document_id} ({chunks} chunks)")
+    return chunks
+
+
+def file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def store_bytes() -> int:
+    total = 0
+    for root, _, files in os.walk(DB_DIR):
+        total += sum(file_size(os.path.join(root, f)) for f in files)
+    return total
+
+
+def document_stats(document_id: str) -> dict | None:
+    """
+    Registry counts plus an estimate of the document's share of the store:
+    chunk text, float32 vectors and its lexical index file. Chroma doesn't
+    report per-document usage, so index overhead is not included.
+    """
+    row = registry.get(document_id)
+    if row is None:
+        return None
+    vector_bytes = row["chunk_count"] * VECTOR_BYTES
+    lexical_bytes = file_size(lexical_store.path(document_id))
+    return dict(
+        row,
+        vector_bytes=vector_bytes,
+        lexical_bytes=lexical_bytes,
+        disk_bytes=row["text_bytes"] + vector_bytes + lexical_bytes
+    )
+
+
+def compact_store() -> int:
+    """
+    Checkpoints and VACUUMs the SQLite files of the store so space freed by
+    deletes goes back to the filesystem. Chroma's HNSW segments reuse the
+    slots of deleted vectors themselves, and a Chroma server compacts its
+    own files. Returns bytes reclaimed.
+    """
+    before = store_bytes()
+    paths = [REGISTRY_PATH, BANK_PATH] if remote() else [CHROMA_SQLITE_PATH, REGISTRY_PATH, BANK_PATH]
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        db = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT)
+        try:
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            db.execute("VACUUM")
+        except sqlite3.OperationalError as e:
+            # busy with a long write; the next sweep tries again
+            print(f"[WARN] Compaction of {path} skipped: {e}")
+        finally:
+            db.close()
+    reclaimed = before - store_bytes()
+    print(f"[DEBUG] Compacted store: {reclaimed} bytes reclaimed")
+    return reclaimed
+
+
+class Lease:
+    """
+    A named lease in SQLite so only one of several worker processes does a
+    job at a time. acquire() takes or renews it for `ttl` seconds; a holder
+    that stops renewing loses it once the ttl has passed.
+    """
+
+    def __init__(self, path: str, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self.db.commit()
+
+    def acquire(self) -> bool:
+        now = time.time()
+        with self.lock:
+            cur = self.db.execute(
+                """
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+                """,
+                (self.name, self.owner, now + self.ttl, now)
+            )
+            self.db.commit()
+            return cur.rowcount == 1
+
+
+class Sweeper:
+    """
+    Background thread that deletes expired documents every `interval`
+    seconds and compacts the store once `compact_after` chunks have been
+    deleted since the last compaction (by the sweeper or by delete()).
+    With `jobs`, every delete holds its begin_delete()/end_delete() so no
+    ingestion starts for the document meanwhile; documents being ingested
+    are left for the next sweep. With a `lease`, only the worker process
+    holding it sweeps.
+    """
+
+    def __init__(self, jobs=None, interval: int = LIFECYCLE_SWEEP_INTERVAL, compact_after: int = COMPACT_MIN_DELETED_CHUNKS,
+                 lease: Lease | None = None):
+        self.jobs = jobs
+        self.lease = lease
+        self.interval = interval
+        self.compact_after = compact_after
+        self.deleted_chunks = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None and self.interval > 0:
+            self.thread = threading.Thread(target=self._loop, name="lifecycle-sweeper", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def delete(self, document_id: str) -> int | None:
+        """
+        Raises JobConflict while the document is being ingested.
+        """
+        if self.jobs is not None:
+            self.jobs.begin_delete(document_id)
+        try:
+            deleted = delete_document(document_id)
+        finally:
+            if self.jobs is not None:
+                self.jobs.end_delete(document_id)
+        if deleted:
+            with self.lock:
+                self.deleted_chunks += deleted
+        return deleted
+
+    def sweep(self) -> dict:
+        if self.lease is not None and not self.lease.acquire():
+            return {"documents": 0, "chunks": 0, "bytes_reclaimed": 0}
+        expired, deleted = [], 0
+        for document_id in registry.expired():
+            try:
+                deleted += self.delete(document_id) or 0
+            except JobConflict:
+                continue  # being ingested (or deleted); next sweep
+            expired.append(document_id)
+
+        with self.lock:
+            due = self.deleted_chunks >= self.compact_after
+            if due:
+                self.deleted_chunks = 0
+        reclaimed = compact_store() if due else 0
+
+        if expired:
+            print(f"[DEBUG] Sweeper: deleted {len(expired)} expired documents ({deleted} chunks)")
+        return {"documents": len(expired), "chunks": deleted, "bytes_reclaimed": reclaimed}
+
+    def _loop(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[ERROR] Lifecycle sweep failed: {e}")
@@ -1,19 +1,47 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import uuid
 import json
 
+from app.config import INGEST_WORKERS, MAX_INGEST_JOBS, LIFECYCLE_SWEEP_INTERVAL, WORKER_PROCESSES
+from app.vectorstore.chroma import remote
+from app.jobs import JobManager, JobStore, JobQueueFull, JobConflict, JOBS_PATH
+
 from app.models import (
     GenerateRequest, 
     GenerateResponse, 
     IngestUrlRequest, 
     RefineRequest,
-    BatchRefineRequest
+    BatchRefineRequest,
+    IngestJobStatus,
+    DocumentStats
 )
-from app.ingestion.loader import load_pdf, load_ppt, load_website
+from app.ingestion.loader import load_website
+from app.ingestion.browser import browser_pool
 from app.ingestion.indexer import index_document
-from app.rag.retriever import retrieve
-from app.rag.generator import generate_questions
+from app.ingestion.uploads import (
+    SUPPORTED_EXTENSIONS,
+    upload_extension,
+    spool_upload,
+    iter_file,
+    remove_quietly
+)
+from app.rag.retriever import retrieve, choose_k
+from app.rag.generator import (
+    generate_questions_async,
+    stream_questions_async,
+    refine_question_async,
+    batch_refine_questions_async,
+    InsufficientContext
+)
+from app.ingestion.embedder import embed_async
+from app.rag.cache import generation_cache
+from app.rag.bank import question_bank, bank_filler
+from app import rate_limit
+from app.lifecycle import Sweeper, Lease, expiry, document_stats, store_bytes
+from app.vectorstore.registry import registry, REGISTRY_PATH
 
 app = FastAPI()
 
@@ -25,79 +53,208 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/upload")
+# Parsing and indexing run as background jobs on a bounded worker pool;
+# clients poll GET /jobs/{job_id} for progress. Job state is shared by all
+# worker processes through the job store.
+jobs = JobManager(workers=INGEST_WORKERS, max_active=MAX_INGEST_JOBS, store=JobStore(JOBS_PATH))
+
+# Deletes expired documents (never one that is being ingested); with
+# several worker processes the lease picks the one that sweeps
+sweeper = Sweeper(
+    jobs=jobs,
+    lease=Lease(REGISTRY_PATH, "lifecycle-sweeper", ttl=2 * LIFECYCLE_SWEEP_INTERVAL)
+)
+
+
+@app.on_event("startup")
+def startup():
+    if WORKER_PROCESSES > 1 and not remote():
+        print("[WARN] WORKER_PROCESSES > 1 with a local Chroma store; set CHROMA_HOST to share a Chroma server")
+    sweeper.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    sweeper.stop()
+    browser_pool.close()
+
+
+def index_and_bank(document_id: str, sections, job, ttl_seconds: int | None = None):
+    diff = index_document(document_id, sections, progress=job.update)
+    registry.set_expiry(document_id, expiry(ttl_seconds))
+    if not diff["added"] and not diff["removed"]:
+        # same content as before: the banked questions still apply
+        return
+    # banked questions belong to the previous content
+    question_bank.clear(document_id)
+    if bank_filler is not None:
+        bank_filler.schedule(document_id)
+
+
+def submit_job(document_id: str, kind: str, fingerprint: str, fn, reuse_done: bool = True):
+    try:
+        return jobs.submit(document_id, kind, fingerprint, fn, reuse_done=reuse_done)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/upload", status_code=202)
 async def upload(
     file: UploadFile = File(...),
-    document_id: str = Form(None)
+    document_id: str = Form(None),
+    ttl_seconds: int = Form(None, ge=0)
 ):
     if not document_id:
         document_id = str(uuid.uuid4())
-    
-    path = f"/tmp/{file.filename}"
 
-    with open(path, "wb") as f:
-        f.write(await file.read())
-
-    if file.filename.endswith(".pdf"):
-        sections = load_pdf(path)
-    elif file.filename.endswith(".pptx"):
-        sections = load_ppt(path)
-    else:
+    if upload_extension(file.filename) not in SUPPORTED_EXTENSIONS:
         return {"error": "Unsupported file type"}
 
-    index_document(document_id, sections)
+    # The upload has to be copied out before the request ends
+    path, content_hash = await run_in_threadpool(spool_upload, file.file, file.filename)
+    filename = file.filename
+
+    def run(job):
+        try:
+            job.update(stage="indexing")
+            sections = job.track_sections(iter_file(path, filename))
+            index_and_bank(document_id, sections, job, ttl_seconds)
+        finally:
+            remove_quietly(path)
 
-    return {"document_id": document_id}
+    try:
+        job, created = submit_job(document_id, "upload", content_hash, run)
+    except HTTPException:
+        remove_quietly(path)
+        raise
+    if not created:
+        remove_quietly(path)
+        if job.status == "done" and ttl_seconds is not None:
+            # same content, already indexed: only the ttl changes
+            registry.set_expiry(document_id, expiry(ttl_seconds))
 
+    return {
+        "document_id": document_id,
+        "job_id": job.job_id,
+        "status": job.status,
+        "content_hash": content_hash
+    }
 
-@app.post("/ingest/url")
-def ingest_url(req: IngestUrlRequest):
+
+@app.post("/ingest/url", status_code=202)
+async def ingest_url(req: IngestUrlRequest):
     print(f"[DEBUG] Ingesting URL: {req.url} with ID: {req.document_id}")
-    sections = load_website(req.url)
-    
-    if not sections:
-         print("[DEBUG] No sections loaded")
-         raise HTTPException(
-            status_code=400,
-            detail="Failed to scrape content from URL"
-        )
-    
-    print(f"[DEBUG] Sections loaded: {len(sections)}")
-    index_document(req.document_id, sections)
-    return {"status": "success", "document_id": req.document_id}
+
+    def run(job):
+        job.update(stage="fetching")
+        sections = load_website(req.url)
+        if not sections:
+            print("[DEBUG] No sections loaded")
+            raise ValueError("Failed to scrape content from URL")
+
+        print(f"[DEBUG] Sections loaded: {len(sections)}")
+        job.update(stage="indexing", fetch_tier=sections[0].get("fetch_tier"))
+        index_and_bank(req.document_id, job.track_sections(sections), job, req.ttl_seconds)
+
+    # Pages change under the same URL, so a finished job is never reused;
+    # the static fetch tier's ETag/Last-Modified check keeps re-ingests cheap.
+    job, _ = submit_job(req.document_id, "url", req.url, run, reuse_done=False)
+    return {"document_id": req.document_id, "job_id": job.job_id, "status": job.status}
+
+
+@app.get("/jobs/{job_id}", response_model=IngestJobStatus)
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/documents")
+def list_documents():
+    documents = [document_stats(row["document_id"]) for row in registry.all()]
+    return {"documents": [d for d in documents if d is not None], "store_bytes": store_bytes()}
+
+
+@app.get("/documents/{document_id}", response_model=DocumentStats)
+def get_document(document_id: str):
+    stats = document_stats(document_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return stats
+
+
+@app.delete("/documents/{document_id}")
+def delete_document(document_id: str):
+    try:
+        deleted = sweeper.delete(document_id)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"document_id": document_id, "chunks_deleted": deleted}
+
+
+@app.get("/metrics/llm")
+def llm_metrics():
+    # queue depth per priority lane, throttling and retry counters
+    return rate_limit.snapshot()
 
 
 @app.post("/refine")
-def refine(req: RefineRequest):
-    from app.rag.generator import refine_question
-    
+async def refine(req: RefineRequest):
     try:
-        updated_question = refine_question(req.original_question, req.instruction)
+        updated_question = await refine_question_async(req.original_question, req.instruction)
         return updated_question
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/refine-batch")
-def refine_batch(req: BatchRefineRequest):
-    from app.rag.generator import batch_refine_questions
-    
+async def refine_batch(req: BatchRefineRequest):
     try:
-        updated_questions = batch_refine_questions(req.questions, req.instruction)
+        updated_questions = await batch_refine_questions_async(req.questions, req.instruction)
         return {"questions": updated_questions}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/generate", response_model=GenerateResponse)
-def generate(req: GenerateRequest):
-
+def validate_generate_request(req: GenerateRequest):
     if req.mode == "mcq" and not req.options:
         raise HTTPException(
             status_code=400,
             detail="options is required when mode is mcq"
         )
 
-    chunks = retrieve(req.document_id, k=6)
+
+async def from_bank(req: GenerateRequest) -> list[dict] | None:
+    """
+    Pre-generated questions for topic-less requests, if enough are banked.
+    Schedules a background top-up when the combination runs low.
+    """
+    if bank_filler is None or req.topic:
+        return None
+    questions = await run_in_threadpool(
+        question_bank.take, req.document_id, req.difficulty, req.mode, req.options, req.count
+    )
+    await run_in_threadpool(bank_filler.top_up, req.document_id, req.difficulty, req.mode, req.options)
+    if questions is not None:
+        print(f"[DEBUG] Served {len(questions)} questions from the bank for {req.document_id}")
+    return questions
+
+
+async def prepare_generation(req: GenerateRequest):
+    """
+    Retrieves the request's context.
+    Returns (chunks, params, cache_key).
+    """
+    # LLM/embedding calls are awaited on the event loop; only the local
+    # Chroma/SQLite reads go to the threadpool
+    query_embedding = await embed_async(req.topic) if req.topic else None
+    chunks = await run_in_threadpool(
+        retrieve, req.document_id, k=choose_k(req.count), topic=req.topic, query_embedding=query_embedding
+    )
     
     print(f"[DEBUG] Retrieved {len(chunks)} chunks for ID {req.document_id}")
     for i, c in enumerate(chunks):
@@ -109,14 +266,39 @@ def generate(req: GenerateRequest):
             detail="Insufficient context found in the document. The document might be empty or content extraction failed."
         )
 
-    raw = generate_questions(
-        chunks=chunks,
-        difficulty=req.difficulty,
-        count=req.count,
-        mode=req.mode,
-        options=req.options,
-        topic=req.topic
-    )
+    params = {
+        "difficulty": req.difficulty,
+        "count": req.count,
+        "mode": req.mode,
+        "options": req.options,
+        "topic": req.topic
+    }
+    return chunks, params, generation_cache.key(req.document_id, chunks, params)
+
+
+async def cached_generation(cache_key: str) -> str | None:
+    return await run_in_threadpool(generation_cache.get, cache_key)
+
+
+async def cache_generation(document_id: str, cache_key: str, raw: str):
+    await run_in_threadpool(generation_cache.add, document_id, cache_key, raw)
+
+
+@app.post("/generate", response_model=GenerateResponse)
+async def generate(req: GenerateRequest):
+    validate_generate_request(req)
+    banked = await from_bank(req)
+    if banked is not None:
+        return {"questions": banked}
+
+    chunks, params, cache_key = await prepare_generation(req)
+
+    raw = await cached_generation(cache_key)
+    if raw is not None:
+        print(f"[DEBUG] Generation cache hit for {req.document_id}")
+        return {"questions": json.loads(raw)}
+
+    raw = await generate_questions_async(chunks=chunks, **params)
 
     print("RAW LLM OUTPUT ↓↓↓")
     print(raw)
@@ -136,4 +318,55 @@ def generate(req: GenerateRequest):
             detail="LLM returned invalid JSON"
         )
 
-    return {"questions": questions}
\ No newline at end of file
+    if isinstance(questions, list) and questions:
+        await cache_generation(req.document_id, cache_key, raw)
+
+    return {"questions": questions}
+
+
+@app.post("/generate/stream")
+async def generate_stream(req: GenerateRequest):
+    """
+    Same as /generate, but streams NDJSON: one {"type": "question", ...}
+    line per question as soon as it is generated and validated, then a
+    {"type": "done", "count": n} line (or {"type": "error", "detail": ...}).
+    """
+    validate_generate_request(req)
+    ready = await from_bank(req)
+    if ready is None:
+        chunks, params, cache_key = await prepare_generation(req)
+        cached = await cached_generation(cache_key)
+        if cached is not None:
+            print(f"[DEBUG] Generation cache hit for {req.document_id}")
+            ready = json.loads(cached)
+
+    async def events():
+        if ready is not None:
+            questions = ready
+            for q in questions:
+                yield json.dumps({"type": "question", "question": q}) + "\n"
+            yield json.dumps({"type": "done", "count": len(questions)}) + "\n"
+            return
+
+        questions = []
+        try:
+            async for q in stream_questions_async(chunks=chunks, **params):
+                questions.append(q)
+                yield json.dumps({"type": "question", "question": q}) + "\n"
+        except InsufficientContext as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+            return
+        except Exception as e:
+            print(f"[ERROR] Streaming generation failed: {e}")
+            yield json.dumps({"type": "error", "detail": "Question generation failed"}) + "\n"
+            return
+
+        if questions:
+            await cache_generation(req.document_id, cache_key, json.dumps(questions))
+        yield json.dumps({"type": "done", "count": len(questions)}) + "\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
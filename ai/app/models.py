@@ -14,6 +14,7 @@ class GenerateRequest(BaseModel):
 class IngestUrlRequest(BaseModel):
     url: str
     document_id: str
+    ttl_seconds: Optional[int] = Field(default=None, ge=0)
 
 
 class TextQuestion(BaseModel):
@@ -44,3 +45,33 @@ class BatchRefineRequest(BaseModel):
     questions: List[dict]
     instruction: str
 
+
+
+class IngestJobStatus(BaseModel):
+    job_id: str
+    document_id: str
+    kind: Literal["upload", "url"]
+    status: Literal["queued", "running", "done", "failed"]
+    stage: str
+    pages_processed: int
+    chunks_indexed: int
+    chunks_embedded: int = 0
+    chunks_removed: int = 0
+    chunks_skipped: int = 0
+    tokens_skipped: int = 0
+    lines_stripped: int = 0
+    fetch_tier: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+class DocumentStats(BaseModel):
+    document_id: str
+    chunk_count: int
+    text_bytes: int
+    vector_bytes: int
+    lexical_bytes: int
+    disk_bytes: int
+    indexed_at: float
+    expires_at: Optional[float] = None
@@ -0,0 +1,62 @@
+from functools import lru_cache
+
+from app.config import LLM_MODEL
+from app.prompts.question import (
+    QUESTION_ROLE,
+    MODE_HEADER,
+    MODE_FORMATS,
+    SOURCE_RULES,
+    CONTEXT_SECTION,
+    REQUEST_SECTION,
+)
+from app.tokens import count_tokens
+
+
+@lru_cache(maxsize=None)
+def system_prefix(mode: str) -> str:
+    """
+    Static instructions for one mode: role and rules, only that mode's
+    output format(s), and the source rules. Byte-identical across requests.
+    """
+    return "\n".join(s.strip("\n") for s in [QUESTION_ROLE, MODE_HEADER, *MODE_FORMATS[mode], SOURCE_RULES]).strip()
+
+
+@lru_cache(maxsize=None)
+def system_prefix_tokens(mode: str) -> int:
+    return count_tokens(system_prefix(mode), LLM_MODEL)
+
+
+def build_question_messages(
+    context: str,
+    difficulty: str,
+    count: int,
+    mode: str,
+    options: int | None,
+    topic_instruction: str
+) -> tuple[list[dict], dict]:
+    """
+    Returns (messages, section token counts). Ordered most- to
+    least-stable: system prefix (per mode) -> document context -> request
+    parameters, so repeated calls over the same chunks share the longest
+    possible cached prefix.
+    """
+    context_part = CONTEXT_SECTION.format(context=context).strip()
+    options_instruction = f"Each question must have exactly {options} options." if mode == "mcq" and options else ""
+    request_part = REQUEST_SECTION.format(
+        count=count,
+        difficulty=difficulty,
+        mode=mode.upper(),
+        options_instruction=options_instruction,
+        topic_instruction=topic_instruction
+    ).strip()
+
+    messages = [
+        {"role": "system", "content": system_prefix(mode)},
+        {"role": "user", "content": f"{context_part}\n\n{request_part}"}
+    ]
+    sections = {
+        "system": system_prefix_tokens(mode),
+        "context": count_tokens(context_part, LLM_MODEL),
+        "request": count_tokens(request_part, LLM_MODEL),
+    }
+    return messages, sections
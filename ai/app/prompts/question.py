@@ -1,6 +1,14 @@
-QUESTION_PROMPT = """
+# Bump whenever the question prompt sections change so cached generations are not reused
+PROMPT_VERSION = "2"
+
+# Sections are assembled per request by app.prompts.builder. Everything up to
+# the context is identical for every request in a mode, so the provider can
+# serve it from its prompt-prefix cache.
+
+QUESTION_ROLE = """
 You are a Staff Engineer and Technical Lead at a top-tier tech company.
 Your task is to create a rigorous assessment to test if a candidate has "real-world" understanding of the provided context.
+You are a strict JSON API. Return ONLY valid JSON. Do not include explanations, markdown, or extra text.
 
 ========================
 FOLD 1 — CORE PHILOSOPHY
@@ -25,31 +33,41 @@ FOLD 2 — QUESTION TYPES & CONSTRAINTS
 - "According to the text..." phrasing.
 - **Meta-content**: Do NOT generate questions about the Introduction, Preface, Conclusion, "About the Author", or Table of Contents. Focus ONLY on the core technical/philosophical body content.
 
-{topic_instruction}
+Difficulty levels:
+- Easy: Basic application of rules.
+- Medium: Analysis of relationships.
+- Hard: Synthesis of multiple sections or complex edge cases.
+"""
 
+MODE_HEADER = """
 ========================
-FOLD 3 — QUERY MODES
+FOLD 3 — OUTPUT FORMAT
 ========================
+"""
+
+TEXT_FORMAT = """
 **Mode: TEXT (Short Answer)**
 - Output JSON format:
-{{
+{
   "questions": [
-    {{
+    {
       "question": "Explain the relationship between [Concept A] and [Concept B] as described...",
       "answer": "Detailed model answer (3-5 sentences) citing specific logic from the text.",
       "explanation": "A deeper insight or 'pro-tip' about this concept in the real world.",
       "source": "COPY_THE_HEADER_EXACTLY",
       "context_quote": "The exact sentence from the text that answers this question."
-    }}
+    }
   ]
-}}
+}
+"""
 
+MCQ_FORMAT = """
 **Mode: MCQ (Multiple Choice)**
 - **Distractors**: Wrong options must be plausible common misconceptions, not random nonsense.
 - Output JSON format:
-{{
+{
   "questions": [
-    {{
+    {
       "question": "Which of the following best implies the consequence of [Action]...",
       "type": "mcq",
       "options": ["A", "B", "C", "D"],
@@ -57,16 +75,18 @@ FOLD 3 — QUERY MODES
       "explanation": "Detailed explanation...",
       "source": "COPY_THE_HEADER_EXACTLY",
       "context_quote": "The exact sentence from the text used to derive the answer."
-    }}
+    }
   ]
-}}
+}
+"""
 
+TRUE_FALSE_FORMAT = """
 **Mode: TRUE_FALSE**
 - **Format**: Same as MCQ but options are STRICTLY ["True", "False"].
 - Output JSON format:
-{{
+{
   "questions": [
-    {{
+    {
       "question": "The second law of thermodynamics implies...",
       "type": "true_false",
       "options": ["True", "False"],
@@ -74,10 +94,26 @@ FOLD 3 — QUERY MODES
       "explanation": "Explanation...",
       "source": "COPY_THE_HEADER_EXACTLY",
       "context_quote": "The exact sentence from the text used to derive the answer."
-    }}
+    }
   ]
-}}
+}
+"""
+
+MIXED_FORMAT = """
+**Mode: MIXED**
+- Generate a diverse mix of **MCQ** (approx 60%), **True/False** (20%), and **Short Answer** (20%) questions.
+- Follow the respective formats above. For Short Answer, use "type": "text" and omit "options".
+"""
+
+# Format sections sent for each mode, in order
+MODE_FORMATS = {
+    "text": [TEXT_FORMAT],
+    "mcq": [MCQ_FORMAT],
+    "true_false": [TRUE_FALSE_FORMAT],
+    "mixed": [MCQ_FORMAT, TRUE_FALSE_FORMAT, TEXT_FORMAT, MIXED_FORMAT],
+}
 
+SOURCE_RULES = """
 **CRITICAL INSTRUCTION FOR SOURCE FIELD:**
 The input context has headers in square brackets, like `[file.pdf (Page 2)]` or `[https://website.com/article]`.
 For the "source" field in your JSON, you **MUST** copy that exact string corresponding to the chunk you used.
@@ -85,24 +121,22 @@ For the "source" field in your JSON, you **MUST** copy that exact string corresp
 - If it's a website, it looks like: "https://wikipedia.org/wiki/Atom"
 
 Do NOT invent page numbers for websites. COPY THE HEADER EXACTLY.
+"""
 
-**Mode: MIXED**
-- Generate a diverse mix of **MCQ** (approx 60%), **True/False** (20%), and **Short Answer** (20%) questions.
-- Follow the respective formats above. For Short Answer, use "type": "text" and omit "options".
-
+CONTEXT_SECTION = """
 ========================
 FOLD 4 — INPUT CONTEXT
 ========================
 {context}
+"""
 
+REQUEST_SECTION = """
 ========================
 FOLD 5 — GENERATION
 ========================
 Generate {count} {difficulty} questions in {mode} mode.
-Ensure the difficulty aligns with:
-- Easy: Basic application of rules.
-- Medium: Analysis of relationships.
-- Hard: Synthesis of multiple sections or complex edge cases.
+{options_instruction}
+{topic_instruction}
 
 Return ONLY valid JSON.
 """
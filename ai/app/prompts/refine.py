@@ -19,3 +19,27 @@ Your goal is to REFINE a specific quiz question based on the user's feedback.
 **Output**:
 Return ONLY valid JSON.
 """
+
+REFINE_BATCH_PROMPT = """
+You are a Staff Engineer and Expert Mentor.
+Your goal is to REFINE each of the quiz questions below based on the user's feedback.
+
+**Original Questions** (each with its "index"):
+{questions}
+
+**User Instruction** (applies to every question):
+"{instruction}"
+
+**Constraint**:
+- Refine every question independently; do not merge, drop or reorder them.
+- Return the full updated question JSON object for each one.
+- Keep each question's format (TextQuestion or MCQQuestion).
+- Maintain the "Professional Mentorship" tone.
+- If the user asks to make it harder, introduce nuance, edge cases, or trade-offs.
+- If the user asks for a better explanation, rewrite the 'explanation' field to be more insightful.
+- Ensure the 'correct_answer' is still one of the 'options' if options change.
+
+**Output**:
+Return ONLY valid JSON of the form:
+{{"questions": [{{"index": 0, "question": {{...updated question...}}}}, ...]}}
+"""
@@ -0,0 +1,238 @@
+import itertools
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import (
+    QUESTION_BANK_ENABLED,
+    QUESTION_BANK_DIFFICULTIES,
+    QUESTION_BANK_MODES,
+    QUESTION_BANK_MCQ_OPTIONS,
+    QUESTION_BANK_TARGET,
+    QUESTION_BANK_LOW_WATER,
+    SQLITE_BUSY_TIMEOUT,
+)
+from app.rag.generator import generate_questions, question_terms, is_near_duplicate
+from app.rag.retriever import retrieve_spread, choose_k
+from app.vectorstore.chroma import DB_DIR
+from app.vectorstore.registry import registry
+
+BANK_PATH = os.path.join(DB_DIR, "question_bank.sqlite3")
+
+
+def option_count(mode: str, options: int | None) -> int:
+    # MCQ banks are per option count; other modes don't use one
+    if mode != "mcq":
+        return 0
+    return options or 0
+
+
+class QuestionBank:
+    """
+    Pre-generated, validated questions per (document, difficulty, mode,
+    option count), stored next to the Chroma store with the chunk sources
+    they were generated from. take() hands each question out once, also
+    across worker processes sharing the file.
+    """
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                document_id TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                options INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                context_sources TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                served_at REAL
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS questions_lookup ON questions (document_id, difficulty, mode, options, served_at)"
+        )
+        # document_id -> clear() count, to discard fills of stale content
+        self.db.execute("CREATE TABLE IF NOT EXISTS epochs (document_id TEXT PRIMARY KEY, epoch INTEGER NOT NULL)")
+        self.db.commit()
+
+    def epoch(self, document_id: str) -> int:
+        with self.lock:
+            return self._epoch(document_id)
+
+    def _epoch(self, document_id: str) -> int:
+        row = self.db.execute("SELECT epoch FROM epochs WHERE document_id = ?", (document_id,)).fetchone()
+        return row[0] if row else 0
+
+    def available(self, document_id: str, difficulty: str, mode: str, options: int | None) -> int:
+        with self.lock:
+            return self.db.execute(
+                """
+                SELECT COUNT(*) FROM questions
+                WHERE document_id = ? AND difficulty = ? AND mode = ? AND options = ? AND served_at IS NULL
+                """,
+                (document_id, difficulty, mode, option_count(mode, options))
+            ).fetchone()[0]
+
+    def questions(self, document_id: str, difficulty: str, mode: str, options: int | None) -> list[dict]:
+        # everything banked for the combination, served or not (for dedupe)
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT question FROM questions WHERE document_id = ? AND difficulty = ? AND mode = ? AND options = ?",
+                (document_id, difficulty, mode, option_count(mode, options))
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def add(self, document_id: str, difficulty: str, mode: str, options: int | None,
+            questions: list[dict], context_sources: list[str], epoch: int) -> int:
+        with self.lock:
+            # the write lock is taken first so a clear() in another worker
+            # can't slip in between the epoch check and the insert
+            self.db.execute("BEGIN IMMEDIATE")
+            if self._epoch(document_id) != epoch:
+                self.db.rollback()
+                return 0
+            now = time.time()
+            self.db.executemany(
+                """
+                INSERT INTO questions (document_id, difficulty, mode, options, question, context_sources, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (document_id, difficulty, mode, option_count(mode, options), json.dumps(q), json.dumps(context_sources), now)
+                    for q in questions
+                ]
+            )
+            self.db.commit()
+        return len(questions)
+
+    def take(self, document_id: str, difficulty: str, mode: str, options: int | None, count: int) -> list[dict] | None:
+        """
+        Marks and returns `count` unserved questions in random order, or
+        None (taking nothing) if fewer are banked.
+        """
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = self.db.execute(
+                """
+                SELECT id, question FROM questions
+                WHERE document_id = ? AND difficulty = ? AND mode = ? AND options = ? AND served_at IS NULL
+                ORDER BY RANDOM() LIMIT ?
+                """,
+                (document_id, difficulty, mode, option_count(mode, options), count)
+            ).fetchall()
+            if len(rows) < count:
+                self.db.rollback()
+                return None
+            self.db.executemany(
+                "UPDATE questions SET served_at = ? WHERE id = ?",
+                [(time.time(), row[0]) for row in rows]
+            )
+            self.db.commit()
+        return [json.loads(row[1]) for row in rows]
+
+    def clear(self, document_id: str):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute(
+                "INSERT INTO epochs (document_id, epoch) VALUES (?, 1) ON CONFLICT(document_id) DO UPDATE SET epoch = epoch + 1",
+                (document_id,)
+            )
+            self.db.execute("DELETE FROM questions WHERE document_id = ?", (document_id,))
+            self.db.commit()
+
+
+class BankFiller:
+    """
+    Fills the bank in the background: after ingestion for every planned
+    (difficulty, mode) combination, and again whenever serving takes a
+    combination below `low_water`. At most one fill per combination runs
+    at a time; fills use the bulk rate-limit lane.
+    """
+
+    def __init__(self, bank: QuestionBank, plan: list[tuple[str, str, int | None]], target: int, low_water: int):
+        self.bank = bank
+        self.plan = plan
+        self.target = target
+        self.low_water = low_water
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="question-bank")
+        self.in_flight = set()
+        self.lock = threading.Lock()
+
+    def schedule(self, document_id: str):
+        for difficulty, mode, options in self.plan:
+            self._submit(document_id, difficulty, mode, options)
+
+    def top_up(self, document_id: str, difficulty: str, mode: str, options: int | None):
+        if (difficulty, mode, option_count(mode, options) or None) not in self.plan:
+            return
+        if self.bank.available(document_id, difficulty, mode, options) < self.low_water:
+            self._submit(document_id, difficulty, mode, options)
+
+    def _submit(self, document_id, difficulty, mode, options):
+        key = (document_id, difficulty, mode, option_count(mode, options))
+        with self.lock:
+            if key in self.in_flight:
+                return
+            self.in_flight.add(key)
+        self.executor.submit(self._fill, key, document_id, difficulty, mode, options)
+
+    def _fill(self, key, document_id, difficulty, mode, options):
+        epoch = None
+        try:
+            epoch = self.bank.epoch(document_id)
+            needed = self.target - self.bank.available(document_id, difficulty, mode, options)
+            chunk_count = registry.chunk_count(document_id)
+            if needed <= 0 or not chunk_count:
+                return
+
+            # a random offset varies which chunks successive fills read
+            chunks = retrieve_spread(document_id, choose_k(needed), chunk_count, offset=random.random())
+            if not chunks:
+                return
+            raw = generate_questions(chunks, difficulty, needed, mode, options, lane="bulk")
+            if "insufficient context" in raw.lower():
+                return
+            generated = json.loads(raw)
+
+            seen = [question_terms(q) for q in self.bank.questions(document_id, difficulty, mode, options)]
+            fresh = []
+            for q in generated:
+                terms = question_terms(q)
+                if not is_near_duplicate(terms, seen):
+                    seen.append(terms)
+                    fresh.append(q)
+
+            added = self.bank.add(document_id, difficulty, mode, options, fresh, [c["source"] for c in chunks], epoch)
+            print(f"[DEBUG] Question bank: +{added} {difficulty}/{mode} questions for {document_id}")
+        except Exception as e:
+            print(f"[WARN] Question bank fill failed for {document_id} ({difficulty}/{mode}): {e}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(key)
+            # re-indexed while this fill ran: its questions were discarded and
+            # the schedule() for the new content skipped this key
+            if epoch is not None and self.bank.epoch(document_id) != epoch:
+                self._submit(document_id, difficulty, mode, options)
+
+
+question_bank = QuestionBank(BANK_PATH)
+
+bank_filler = BankFiller(
+    question_bank,
+    plan=[
+        (difficulty, mode, QUESTION_BANK_MCQ_OPTIONS if mode == "mcq" else None)
+        for difficulty, mode in itertools.product(QUESTION_BANK_DIFFICULTIES, QUESTION_BANK_MODES)
+    ],
+    target=QUESTION_BANK_TARGET,
+    low_water=QUESTION_BANK_LOW_WATER
+) if QUESTION_BANK_ENABLED else None
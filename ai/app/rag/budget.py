@@ -0,0 +1,105 @@
+from app.config import (
+    LLM_MODEL,
+    CONTEXT_MIN_TOKENS,
+    CONTEXT_TOKENS_PER_QUESTION,
+    CONTEXT_MODE_FACTORS,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_MIN_CHUNK_TOKENS,
+)
+from app.ingestion.chunker import SENTENCE_END
+from app.tokens import count_tokens_batch
+
+
+def context_budget(count: int, mode: str) -> int:
+    wanted = CONTEXT_MIN_TOKENS + count * CONTEXT_TOKENS_PER_QUESTION * CONTEXT_MODE_FACTORS.get(mode, 1.0)
+    return int(min(CONTEXT_MAX_TOKENS, wanted))
+
+
+def diverse_order(chunks: list[dict]) -> list[int]:
+    """
+    Chunk indexes round-robin over sources (in order of first appearance),
+    keeping retrieval order within a source, so dropping from the tail
+    removes repeats of already-covered sources first.
+    """
+    groups = {}
+    for i, c in enumerate(chunks):
+        groups.setdefault(c["source"], []).append(i)
+    order = []
+    for rank in range(max((len(g) for g in groups.values()), default=0)):
+        order.extend(g[rank] for g in groups.values() if rank < len(g))
+    return order
+
+
+def allocate(sizes: list[int], budget: int) -> list[int]:
+    """
+    Water-filling: chunks smaller than an equal share keep everything and
+    their leftover is split among the larger ones.
+    """
+    allocation = [0] * len(sizes)
+    remaining = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    while remaining:
+        share = budget // len(remaining)
+        i = remaining.pop(0)
+        allocation[i] = min(sizes[i], share)
+        budget -= allocation[i]
+    return allocation
+
+
+def truncate_sentences(text: str, max_tokens: int) -> str:
+    """
+    Longest prefix of whole sentences within `max_tokens`; a first sentence
+    that alone is too long is cut at a word boundary.
+    """
+    sentences = [s for s in SENTENCE_END.split(text) if s]
+    counts = count_tokens_batch(sentences, LLM_MODEL)
+    kept, used = [], 0
+    for sentence, n in zip(sentences, counts):
+        if used + n > max_tokens:
+            break
+        kept.append(sentence)
+        used += n
+    if kept:
+        return " ".join(kept)
+    words = sentences[0].split() if sentences else []
+    ratio = max_tokens / max(counts[0], 1) if counts else 0
+    return " ".join(words[:int(len(words) * ratio)]) + " …"
+
+
+def fit_context(chunks: list[dict], count: int, mode: str) -> list[dict]:
+    """
+    Fits retrieved chunks into the request's context budget. Everything is
+    kept when it fits; otherwise each chunk gets a fair share of the budget
+    and is cut at sentence boundaries, and only if shares would get too
+    small are chunks from already-covered sources dropped. Retrieval order
+    is preserved.
+    """
+    if not chunks:
+        return chunks
+    budget = context_budget(count, mode)
+    # header line "[source]" counts against the budget too
+    sizes = count_tokens_batch([f"[{c['source']}]\n{c['text']}" for c in chunks], LLM_MODEL)
+    total = sum(sizes)
+    if total <= budget:
+        print(f"[DEBUG] Context budget: {total}/{budget} tokens, {len(chunks)} chunks, none truncated")
+        return chunks
+
+    order = diverse_order(chunks)
+    keep = max(1, min(len(order), budget // CONTEXT_MIN_CHUNK_TOKENS))
+    kept = sorted(order[:keep])
+    allocation = allocate([sizes[i] for i in kept], budget)
+
+    fitted, truncated = [], 0
+    for i, tokens in zip(kept, allocation):
+        chunk = chunks[i]
+        if tokens < sizes[i]:
+            header = sizes[i] - count_tokens_batch([chunk["text"]], LLM_MODEL)[0]
+            chunk = dict(chunk, text=truncate_sentences(chunk["text"], max(tokens - header, 1)))
+            truncated += 1
+        fitted.append(chunk)
+    used = sum(count_tokens_batch([f"[{c['source']}]\n{c['text']}" for c in fitted], LLM_MODEL))
+
+    print(
+        f"[DEBUG] Context budget: {used}/{budget} tokens (from {total}), "
+        f"kept {len(fitted)}/{len(chunks)} chunks, truncated {truncated}"
+    )
+    return fitted
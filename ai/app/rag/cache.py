@@ -0,0 +1,199 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import (
+    LLM_MODEL,
+    REDIS_URL,
+    GENERATION_CACHE_TTL,
+    GENERATION_CACHE_MAX_ENTRIES,
+    GENERATION_CACHE_VARIANTS,
+    GENERATION_CACHE_REDIS_RETRY_MAX,
+)
+from app.prompts.question import PROMPT_VERSION
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+
+def chunk_fingerprint(chunks: list[dict]) -> str:
+    h = hashlib.sha256()
+    for c in chunks:
+        h.update(c["source"].encode("utf-8"))
+        h.update(b"\0")
+        h.update(c["text"].encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class MemoryBackend:
+    """
+    In-process fallback: LRU over keys, each holding a list of variants
+    and an expiry time.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires_at, [variants])
+        self.by_document = {}
+        self.lock = threading.Lock()
+
+    def variants(self, key: str) -> list[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return []
+            if entry[0] < time.time():
+                del self.entries[key]
+                return []
+            self.entries.move_to_end(key)
+            return list(entry[1])
+
+    def add(self, document_id: str, key: str, raw: str, ttl: int, max_variants: int):
+        with self.lock:
+            _, variants = self.entries.get(key, (0, []))
+            variants = ([raw] + variants)[:max_variants]
+            self.entries[key] = (time.time() + ttl, variants)
+            self.entries.move_to_end(key)
+            self.by_document.setdefault(document_id, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, document_id: str) -> int:
+        with self.lock:
+            keys = self.by_document.pop(document_id, set())
+            return sum(1 for k in keys if self.entries.pop(k, None) is not None)
+
+
+class RedisBackend:
+    """
+    Variants live in a Redis list per key with a TTL; a set per document
+    tracks its keys for invalidation. LRU eviction is left to Redis'
+    maxmemory policy.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def variants(self, key: str) -> list[str]:
+        return self.client.lrange(key, 0, -1)
+
+    def add(self, document_id: str, key: str, raw: str, ttl: int, max_variants: int):
+        doc_key = f"gen:doc:{document_id}"
+        pipe = self.client.pipeline()
+        pipe.lpush(key, raw)
+        pipe.ltrim(key, 0, max_variants - 1)
+        pipe.expire(key, ttl)
+        pipe.sadd(doc_key, key)
+        pipe.expire(doc_key, ttl)
+        pipe.execute()
+
+    def invalidate(self, document_id: str) -> int:
+        doc_key = f"gen:doc:{document_id}"
+        keys = self.client.smembers(doc_key)
+        if not keys:
+            return 0
+        return self.client.delete(*keys, doc_key) - 1
+
+
+class GenerationCache:
+    """
+    Caches generate_questions output keyed by the retrieved chunk set, the
+    request parameters, the model and PROMPT_VERSION. Uses Redis when
+    reachable and an in-process LRU otherwise. Redis is connected on first
+    use; after a failed connect or a Redis error the client is dropped and
+    reconnected with exponential backoff (up to `retry_max` seconds).
+
+    Up to `max_variants` results are kept per key; until a key has that
+    many, lookups miss so new variants get generated, after which repeat
+    requests rotate between them.
+    """
+
+    def __init__(self, ttl: int, max_entries: int, max_variants: int, retry_max: float = GENERATION_CACHE_REDIS_RETRY_MAX):
+        self.ttl = ttl
+        self.max_variants = max_variants
+        self.retry_max = retry_max
+        self.memory = MemoryBackend(max_entries)
+        self.redis = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "redis_errors": 0}
+
+    def _backend(self):
+        with self.lock:
+            if self.redis is None and redis is not None and REDIS_URL and time.monotonic() >= self.retry_at:
+                self.redis = self._connect()
+                if self.redis is None:
+                    self._backoff()
+                else:
+                    self.failures = 0
+            return self.redis
+
+    def _backoff(self):
+        self.failures += 1
+        self.retry_at = time.monotonic() + min(2 ** (self.failures - 1), self.retry_max)
+
+    def _connect(self):
+        try:
+            client = redis.Redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=0.5, socket_connect_timeout=0.5)
+            client.ping()
+            print(f"[DEBUG] Generation cache using Redis at {REDIS_URL}")
+            return RedisBackend(client)
+        except Exception as e:
+            print(f"[WARN] Redis unavailable for generation cache ({e}); using in-process cache")
+            return None
+
+    def _call(self, method: str, *args):
+        backend = self._backend()
+        if backend is not None:
+            try:
+                return getattr(backend, method)(*args)
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                print(f"[WARN] Generation cache Redis error: {e}; reconnecting later")
+                with self.lock:
+                    if self.redis is backend:
+                        self.redis = None
+                        self._backoff()
+        return getattr(self.memory, method)(*args)
+
+    def key(self, document_id: str, chunks: list[dict], params: dict) -> str:
+        payload = json.dumps({
+            "chunks": chunk_fingerprint(chunks),
+            "params": params,
+            "model": LLM_MODEL,
+            "prompt_version": PROMPT_VERSION,
+        }, sort_keys=True)
+        return f"gen:{document_id}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> str | None:
+        variants = self._call("variants", key)
+        if len(variants) < self.max_variants:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return random.choice(variants)
+
+    def add(self, document_id: str, key: str, raw: str):
+        self._call("add", document_id, key, raw, self.ttl, self.max_variants)
+
+    def invalidate_document(self, document_id: str):
+        removed = self._call("invalidate", document_id)
+        # the in-process copy may hold entries written while Redis was down
+        if self.redis is not None:
+            removed += self.memory.invalidate(document_id)
+        if removed:
+            print(f"[DEBUG] Invalidated {removed} cached generations for {document_id}")
+
+
+generation_cache = GenerationCache(
+    ttl=GENERATION_CACHE_TTL,
+    max_entries=GENERATION_CACHE_MAX_ENTRIES,
+    max_variants=GENERATION_CACHE_VARIANTS
+)
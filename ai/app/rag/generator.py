@@ -1,8 +1,30 @@
-from openai import OpenAI
-from app.config import OPENAI_API_KEY, LLM_MODEL
-from app.prompts.question import QUESTION_PROMPT
-
-client = OpenAI(api_key=OPENAI_API_KEY)
+import asyncio
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app.clients import openai_client, async_openai_client
+from app.rate_limit import llm_scheduler, estimate_chat_tokens
+from app.tokens import count_tokens_batch
+from app.config import (
+    LLM_MODEL,
+    GENERATION_TOKENS_PER_QUESTION,
+    REFINE_OUTPUT_TOKENS,
+    REFINE_BATCH_MAX_ITEMS,
+    REFINE_BATCH_MAX_TOKENS,
+    GENERATION_SHARD_SIZE,
+    GENERATION_MAX_SHARDS,
+    GENERATION_DEDUP_THRESHOLD,
+)
+from app.prompts.builder import build_question_messages
+from app.rag.budget import fit_context
+from app.vectorstore.lexical import tokenize
+
+client = openai_client
+async_client = async_openai_client
+
+MAX_RETRIES = 3
 
 
 def clean_json(text: str) -> str:
@@ -31,69 +53,74 @@ def sanitize_input(text: str | None) -> str:
         cleaned = cleaned.replace(p.upper(), "[REDACTED]")
         cleaned = cleaned.replace(p.title(), "[REDACTED]")
     return cleaned.strip()
-def validate_questions(questions: list[dict]) -> list[dict]:
+
+
+BLOCKLIST = ["damn", "hell", "fuck", "shit", "bitch"]  # Add more as needed
+
+
+def question_problem(q: dict) -> str | None:
     """
-    Guardrail: Validates logical integrity of generated questions.
-    Filters out questions that fail these checks:
-    1. 'correct_answer' must exist in 'options' (for MCQ).
+    Guardrail for a single question: returns why it should be dropped,
+    or None if it passes.
+    1. Mandatory fields must not be empty.
     2. 'options' must have at least 2 items (for MCQ).
-    3. Mandatory fields must not be empty.
+    3. 'correct_answer' must exist in 'options' (for MCQ).
     """
-    valid_questions = []
+    q_type = q.get("type", "mcq").lower()
 
-    for idx, q in enumerate(questions):
-        try:
-            q_type = q.get("type", "mcq").lower()
-
-            # GLOBAL CHECKS
-            if not q.get("question") or not q.get("correct_answer"):
-                print(f"[WARN] Guardrail: Dropping Q{idx+1} due to missing fields.")
-                continue
-
-            # MCQ / TRUE_FALSE SPECIFIC CHECKS
-            if q_type in ["mcq", "true_false", "mixed"]:
-                options = q.get("options", [])
-                correct = q.get("correct_answer")
-
-                if not isinstance(options, list) or len(options) < 2:
-                    print(f"[WARN] Guardrail: Dropping Q{idx+1} due to insufficient options.")
-                    continue
-                
-                # Check if correct answer is in options (loose string match)
-                # We stripe whitespace and lower case for robust comparison
-                normalized_options = [str(o).strip().lower() for o in options]
-                normalized_correct = str(correct).strip().lower()
-
-                if normalized_correct not in normalized_options:
-                     print(f"[WARN] Guardrail: Dropping Q{idx+1} - Correct answer '{correct}' not found in options {options}.")
-                     continue
-            
-            # CONTENT SAFETY CHECK (Basic List)
-            # In production, use a library like `better-profanity` or an API.
-            blocklist = ["damn", "hell", "fuck", "shit", "bitch"] # Add more as needed
-            combined_text = (q.get("question", "") + " " + q.get("answer", "") + " " + q.get("explanation", "")).lower()
-            
-            if any(bad in combined_text for bad in blocklist):
-                 print(f"[WARN] Guardrail: Dropping Q{idx+1} due to profanity/unsafe content.")
-                 continue
-
-            valid_questions.append(q)
+    # GLOBAL CHECKS
+    if not q.get("question") or not q.get("correct_answer"):
+        return "missing fields"
 
-        except Exception as e:
-            print(f"[ERROR] Guardrail verification failed for Q{idx+1}: {e}")
-            continue
+    # MCQ / TRUE_FALSE SPECIFIC CHECKS
+    if q_type in ["mcq", "true_false", "mixed"]:
+        options = q.get("options", [])
+        correct = q.get("correct_answer")
+
+        if not isinstance(options, list) or len(options) < 2:
+            return "insufficient options"
+
+        # Check if correct answer is in options (loose string match)
+        # We stripe whitespace and lower case for robust comparison
+        normalized_options = [str(o).strip().lower() for o in options]
+        normalized_correct = str(correct).strip().lower()
+
+        if normalized_correct not in normalized_options:
+            return f"correct answer '{correct}' not found in options {options}"
+
+    # CONTENT SAFETY CHECK (Basic List)
+    # In production, use a library like `better-profanity` or an API.
+    combined_text = (q.get("question", "") + " " + q.get("answer", "") + " " + q.get("explanation", "")).lower()
+    if any(bad in combined_text for bad in BLOCKLIST):
+        return "profanity/unsafe content"
+
+    return None
+
+
+def check_question(q: dict, idx: int) -> bool:
+    try:
+        problem = question_problem(q)
+    except Exception as e:
+        print(f"[ERROR] Guardrail verification failed for Q{idx+1}: {e}")
+        return False
+    if problem:
+        print(f"[WARN] Guardrail: Dropping Q{idx+1} - {problem}.")
+        return False
+    return True
+
+
+def validate_questions(questions: list[dict]) -> list[dict]:
+    """
+    Guardrail: Validates logical integrity of generated questions and
+    filters out the ones failing check_question.
+    """
+    valid_questions = [q for idx, q in enumerate(questions) if check_question(q, idx)]
 
     print(f"[DEBUG] Guardrail: {len(valid_questions)}/{len(questions)} questions passed validation.")
     return valid_questions
 
-def generate_questions(
-    chunks,
-    difficulty: str,
-    count: int,
-    mode: str,
-    options: int | None,
-    topic: str | None = None
-):
+
+def build_messages(chunks, difficulty: str, count: int, mode: str, options: int | None, topic: str | None = None) -> list[dict]:
     # Guardrail: Sanitize Inputs
     topic = sanitize_input(topic)
     # Difficulty is an enum in pydantic, but good to be safe if passed as str
@@ -105,111 +132,443 @@ def generate_questions(
 
     topic_instruction = f"IMPORTANT: The user wants to focus specifically on these topics: {topic}. Prioritize generating questions related to this." if topic else ""
 
-    prompt = QUESTION_PROMPT.format(
-        context=context,
-        difficulty=difficulty,
-        count=count,
-        mode=mode.upper(),
-        options=options if options else "",
-        topic_instruction=topic_instruction
-    )
+    messages, sections = build_question_messages(context, difficulty, count, mode, options, topic_instruction)
+    print(f"[DEBUG] Prompt tokens by section: {sections}")
+    return messages
 
-    import json
-    import time
-    
-    MAX_RETRIES = 3
+
+class InsufficientContext(Exception):
+    pass
+
+
+def plan_shards(chunks, count: int) -> list[tuple[list, int]]:
+    """
+    Splits a request into up to GENERATION_MAX_SHARDS (chunks, count)
+    sub-requests of about GENERATION_SHARD_SIZE questions each. Chunks are
+    dealt round-robin, so every shard gets a disjoint subset spread across
+    the document.
+    """
+    shards = max(1, min(math.ceil(count / GENERATION_SHARD_SIZE), GENERATION_MAX_SHARDS, len(chunks)))
+    return [
+        (chunks[i::shards], count // shards + (1 if i < count % shards else 0))
+        for i in range(shards)
+    ]
+
+
+def question_terms(q: dict) -> set[str]:
+    return set(tokenize(str(q.get("question", ""))))
+
+
+def is_near_duplicate(terms: set[str], seen: list[set[str]]) -> bool:
+    for other in seen:
+        union = len(terms | other)
+        if union and len(terms & other) / union >= GENERATION_DEDUP_THRESHOLD:
+            return True
+    return False
+
+
+def dedupe_questions(questions: list[dict]) -> list[dict]:
+    """
+    Drops questions whose wording overlaps an earlier one by at least
+    GENERATION_DEDUP_THRESHOLD (Jaccard over question terms).
+    """
+    kept, seen = [], []
+    for q in questions:
+        terms = question_terms(q)
+        if is_near_duplicate(terms, seen):
+            print(f"[DEBUG] Dropping near-duplicate question: {str(q.get('question'))[:60]}...")
+            continue
+        kept.append(q)
+        seen.append(terms)
+    return kept
+
+
+def parse_completion(raw: str) -> list[dict]:
+    """
+    Parses a question-generation completion and applies the guardrails.
+    Raises json.JSONDecodeError / ValueError for output worth retrying and
+    InsufficientContext when the model declined the context.
+    """
+    cleaned = clean_json(raw)
     
-    print(f"[DEBUG] PROMPT:\n{prompt}\n[DEBUG] END PROMPT")
+    # Verify it's valid JSON before returning
+    parsed = json.loads(cleaned)
+
+    # If we used strict mode, it returns {"questions": [...]}. Unwrap it.
+    if isinstance(parsed, dict) and "questions" in parsed:
+        final_questions_list = parsed["questions"]
+    elif isinstance(parsed, list):
+        final_questions_list = parsed
+    elif "insufficient context" in cleaned.lower():
+        raise InsufficientContext("Insufficient context provided in the document")
+    else:
+        # Should not happen with strict mode + correct prompt
+        raise ValueError("Unexpected JSON structure")
+
+    # Apply Guardrails
+    # If we lost too many questions (e.g. > 50%), maybe we should retry?
+    # For now, let's just return what we have to be safe and fast.
+    return validate_questions(final_questions_list)
+
+
+def retry_delay(e: Exception, attempt: int) -> float | None:
+    """
+    Seconds to wait before retrying after `e`, or None to give up.
+    Rate limits and transient API errors are already retried by the
+    scheduler (app.rate_limit); this covers bad completions.
+    """
+    if isinstance(e, InsufficientContext):
+        return None
+    if isinstance(e, ValueError):  # includes json.JSONDecodeError
+        print(f"[WARN] LLM returned invalid JSON (attempt {attempt+1}). Retrying...")
+        return 1 if attempt < MAX_RETRIES - 1 else 0
+    print(f"[ERROR] LLM generation error: {e}")
+    return 1 if attempt < MAX_RETRIES - 1 else None
+
+
+def generate_shard(
+    chunks,
+    difficulty: str,
+    count: int,
+    mode: str,
+    options: int | None,
+    topic: str | None = None,
+    lane: str = "generate"
+) -> list[dict]:
+    """
+    One LLM call (with retries) for `count` questions over `chunks`.
+    Returns the questions that pass the guardrails.
+    """
+    messages = build_messages(chunks, difficulty, count, mode, options, topic)
+    estimate = estimate_chat_tokens(messages, count * GENERATION_TOKENS_PER_QUESTION)
 
     for attempt in range(MAX_RETRIES):
         try:
-            res = client.chat.completions.create(
+            res = llm_scheduler.call(
+                client.chat.completions.create,
+                tokens=estimate,
+                lane=lane,
                 model=LLM_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a strict JSON API. "
-                            "Return ONLY valid JSON. "
-                            "Do not include explanations, markdown, or extra text."
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+                messages=messages,
                 response_format={"type": "json_object"},
                 temperature=0.2
             )
+            return parse_completion(res.choices[0].message.content)
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+    raise Exception("Failed to generate valid JSON after retries")
+
+
+async def generate_shard_async(
+    chunks,
+    difficulty: str,
+    count: int,
+    mode: str,
+    options: int | None,
+    topic: str | None = None
+) -> list[dict]:
+    """
+    Coroutine version of generate_shard.
+    """
+    messages = build_messages(chunks, difficulty, count, mode, options, topic)
+    estimate = estimate_chat_tokens(messages, count * GENERATION_TOKENS_PER_QUESTION)
 
-            raw = res.choices[0].message.content
-            cleaned = clean_json(raw)
-            
-            # Verify it's valid JSON before returning
-            parsed = json.loads(cleaned)
-            
-            final_questions_list = []
-
-            # If we used strict mode, it returns {"questions": [...]}. Unwrap it.
-            if isinstance(parsed, dict) and "questions" in parsed:
-                final_questions_list = parsed["questions"]
-            elif isinstance(parsed, list):
-                final_questions_list = parsed
-            else:
-                 # Should not happen with strict mode + correct prompt, but fallback
-                 print("[WARN] Unexpected JSON structure, returning raw parse.")
-                 return cleaned
-
-            # Apply Guardrails
-            validated = validate_questions(final_questions_list)
-            
-            # If we lost too many questions (e.g. > 50%), maybe we should retry?
-            # For now, let's just return what we have to be safe and fast.
-            return json.dumps(validated)
-
-        except json.JSONDecodeError:
-            print(f"[WARN] LLM returned invalid JSON (attempt {attempt+1}). Retrying...")
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(1)
+    for attempt in range(MAX_RETRIES):
+        try:
+            res = await llm_scheduler.call_async(
+                async_client.chat.completions.create,
+                tokens=estimate,
+                model=LLM_MODEL,
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=0.2
+            )
+            return parse_completion(res.choices[0].message.content)
         except Exception as e:
-             print(f"[ERROR] LLM generation error: {e}")
-             if "rate_limit" in str(e).lower():
-                 time.sleep(5) # Wait longer for rate limits
-             elif attempt < MAX_RETRIES - 1:
-                 time.sleep(1)
-             else:
-                 raise e
+            delay = retry_delay(e, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
 
     raise Exception("Failed to generate valid JSON after retries")
 
 
-def refine_question(original_question: dict, instruction: str):
+def merge_shards(results: list, count: int):
+    """
+    Combines per-shard results (question lists or exceptions) into the
+    generate_questions return value.
+    """
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if len(errors) == len(results):
+        if all(isinstance(e, InsufficientContext) for e in errors):
+            return "Insufficient context."
+        raise errors[0]
+
+    for i, e in enumerate(results):
+        if isinstance(e, BaseException):
+            print(f"[WARN] Generation shard {i} failed: {e}")
+
+    merged = dedupe_questions([q for shard in results if not isinstance(shard, BaseException) for q in shard])
+    print(f"[DEBUG] Merged {len(merged)} questions from {len(results) - len(errors)}/{len(results)} shards")
+    return json.dumps(merged[:count])
+
+
+def generate_questions(
+    chunks,
+    difficulty: str,
+    count: int,
+    mode: str,
+    options: int | None,
+    topic: str | None = None,
+    lane: str = "generate"
+):
+    """
+    Generates `count` questions as a JSON list string. Large requests are
+    fanned out over disjoint chunk subsets in parallel (see plan_shards);
+    each shard retries on its own, so one malformed completion does not
+    redo the whole quiz. Returns "Insufficient context." if every shard
+    declined its context.
+    """
+    shards = plan_shards(fit_context(chunks, count, mode), count)
+    print(f"[DEBUG] Generating {count} questions in {len(shards)} shards: {[n for _, n in shards]}")
+    results = [None] * len(shards)
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        futures = {
+            executor.submit(generate_shard, shard_chunks, difficulty, n, mode, options, topic, lane): i
+            for i, (shard_chunks, n) in enumerate(shards)
+        }
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+
+    return merge_shards(results, count)
+
+
+async def generate_questions_async(
+    chunks,
+    difficulty: str,
+    count: int,
+    mode: str,
+    options: int | None,
+    topic: str | None = None
+):
+    """
+    Coroutine version of generate_questions; shards run as concurrent tasks.
+    """
+    shards = plan_shards(fit_context(chunks, count, mode), count)
+    print(f"[DEBUG] Generating {count} questions in {len(shards)} shards: {[n for _, n in shards]}")
+    results = await asyncio.gather(
+        *(generate_shard_async(shard_chunks, difficulty, n, mode, options, topic) for shard_chunks, n in shards),
+        return_exceptions=True
+    )
+    return merge_shards(list(results), count)
+
+
+class ShardStream:
+    """
+    Per-attempt state of a streamed shard: feeds deltas to the incremental
+    parser and returns the questions that pass the guardrails.
+    """
+
+    def __init__(self):
+        from app.rag.stream_parser import QuestionStreamParser
+        self.parser = QuestionStreamParser()
+        self.raw = []
+        self.seen = 0
+        self.emitted = 0
+
+    def feed(self, event) -> list[dict]:
+        if not event.choices:
+            return []
+        delta = event.choices[0].delta.content
+        if not delta:
+            return []
+        self.raw.append(delta)
+        passed = []
+        for q in self.parser.feed(delta):
+            self.seen += 1
+            if check_question(q, self.seen - 1):
+                self.emitted += 1
+                passed.append(q)
+        return passed
+
+    def finish(self, attempt: int) -> bool:
+        """
+        True if the shard is complete; False if it produced nothing and
+        should be retried.
+        """
+        print(f"[DEBUG] Guardrail: {self.emitted}/{self.seen} streamed questions passed validation.")
+        if self.seen:
+            return True
+        if "insufficient context" in "".join(self.raw).lower():
+            raise InsufficientContext("Insufficient context provided in the document")
+        print(f"[WARN] Stream produced no questions (attempt {attempt+1}). Retrying...")
+        return False
+
+
+async def stream_shard_async(
+    chunks,
+    difficulty: str,
+    count: int,
+    mode: str,
+    options: int | None,
+    topic: str | None = None
+):
+    """
+    Streams one shard: yields each question as soon as the model has
+    finished writing it and it passes the guardrails. A failed attempt is
+    retried only if nothing has been yielded yet. Raises
+    InsufficientContext when the model declines the context.
+    """
+    messages = build_messages(chunks, difficulty, count, mode, options, topic)
+    estimate = estimate_chat_tokens(messages, count * GENERATION_TOKENS_PER_QUESTION)
+
+    for attempt in range(MAX_RETRIES):
+        state = ShardStream()
+        try:
+            stream = await llm_scheduler.call_async(
+                async_client.chat.completions.create,
+                tokens=estimate,
+                model=LLM_MODEL,
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=0.2,
+                stream=True
+            )
+            async for event in stream:
+                for q in state.feed(event):
+                    yield q
+        except Exception as e:
+            print(f"[ERROR] LLM streaming error: {e}")
+            if state.emitted or attempt == MAX_RETRIES - 1:
+                raise
+            await asyncio.sleep(1)
+            continue
+
+        if state.finish(attempt):
+            return
+        if attempt < MAX_RETRIES - 1:
+            await asyncio.sleep(1)
+
+    raise Exception("Failed to generate valid JSON after retries")
+
+
+class StreamMerger:
+    """
+    Collects (kind, value) events from concurrently streaming shards and
+    decides which questions to pass on (first `count`, no near-duplicates).
+    """
+
+    def __init__(self, shards: int, count: int):
+        self.pending = shards
+        self.count = count
+        self.seen = []
+        self.errors = []
+
+    def accept(self, kind: str, value) -> bool:
+        if kind == "question":
+            terms = question_terms(value)
+            if len(self.seen) < self.count and not is_near_duplicate(terms, self.seen):
+                self.seen.append(terms)
+                return True
+            return False
+        self.pending -= 1
+        if kind == "error":
+            print(f"[WARN] Generation shard failed: {value}")
+            self.errors.append(value)
+        return False
+
+    def raise_if_all_failed(self, shards: int):
+        if len(self.errors) == shards:
+            if all(isinstance(e, InsufficientContext) for e in self.errors):
+                raise InsufficientContext("Insufficient context provided in the document")
+            raise self.errors[0]
+
+
+async def stream_questions_async(
+    chunks,
+    difficulty: str,
+    count: int,
+    mode: str,
+    options: int | None,
+    topic: str | None = None
+):
+    """
+    Streaming variant of generate_questions_async. Shards stream
+    concurrently as tasks and questions are yielded in arrival order,
+    skipping near-duplicates. Raises InsufficientContext if every shard
+    declined its context.
+    """
+    shards = plan_shards(fit_context(chunks, count, mode), count)
+    if len(shards) == 1:
+        async for q in stream_shard_async(shards[0][0], difficulty, count, mode, options, topic):
+            yield q
+        return
+
+    events = asyncio.Queue()
+
+    async def run(shard_chunks, n):
+        try:
+            async for q in stream_shard_async(shard_chunks, difficulty, n, mode, options, topic):
+                await events.put(("question", q))
+            await events.put(("done", None))
+        except Exception as e:
+            await events.put(("error", e))
+
+    print(f"[DEBUG] Streaming {count} questions in {len(shards)} shards: {[n for _, n in shards]}")
+    tasks = [asyncio.create_task(run(shard_chunks, n)) for shard_chunks, n in shards]
+    try:
+        merger = StreamMerger(len(shards), count)
+        while merger.pending:
+            kind, value = await events.get()
+            if merger.accept(kind, value):
+                yield value
+        merger.raise_if_all_failed(len(shards))
+    finally:
+        # the client may disconnect mid-stream
+        for task in tasks:
+            task.cancel()
+
+
+def refine_messages(original_question: dict, instruction: str) -> list[dict]:
     from app.prompts.refine import REFINE_PROMPT
-    import json
-    
+
     prompt = REFINE_PROMPT.format(
         original_question=json.dumps(original_question, indent=2),
         instruction=instruction
     )
+    return [
+        {
+            "role": "system",
+            "content": "You are a JSON API. Return ONLY valid JSON."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
 
+async def refine_question_async(original_question: dict, instruction: str, lane: str = "interactive"):
+    messages = refine_messages(original_question, instruction)
     try:
-        res = client.chat.completions.create(
+        res = await llm_scheduler.call_async(
+            async_client.chat.completions.create,
+            tokens=estimate_chat_tokens(messages, REFINE_OUTPUT_TOKENS),
+            lane=lane,
             model=LLM_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a JSON API. Return ONLY valid JSON."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+            messages=messages,
             response_format={"type": "json_object"},
             temperature=0.3
         )
-        
+
         cleaned = clean_json(res.choices[0].message.content)
         return json.loads(cleaned)
     except Exception as e:
@@ -217,28 +576,132 @@ def refine_question(original_question: dict, instruction: str):
         raise e
 
 
-def batch_refine_questions(questions: list[dict], instruction: str):
+def refined_problem(refined) -> str | None:
     """
-    Refines multiple questions in parallel.
-    Doing this in parallel is much faster than sequential.
+    Per-item check for a refined question: still a question, and for
+    option-based ones the correct answer is still among the options.
     """
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    
-    updated_questions = [None] * len(questions)
-    
-    # Helper to keep track of index
-    def process(idx, q):
+    if not isinstance(refined, dict) or not refined.get("question"):
+        return "missing question"
+    if "options" in refined:
+        options = refined["options"]
+        if not isinstance(options, list) or len(options) < 2:
+            return "insufficient options"
+        normalized_options = [str(o).strip().lower() for o in options]
+        if str(refined.get("correct_answer", "")).strip().lower() not in normalized_options:
+            return "correct answer not in options"
+    return None
+
+
+def pack_refinements(questions: list[dict]) -> list[list[int]]:
+    """
+    Groups question indexes into batches of at most REFINE_BATCH_MAX_ITEMS
+    whose serialized questions fit in REFINE_BATCH_MAX_TOKENS.
+    """
+    sizes = count_tokens_batch([json.dumps(q) for q in questions], LLM_MODEL)
+    batches, current, tokens = [], [], 0
+    for idx, size in enumerate(sizes):
+        if current and (len(current) >= REFINE_BATCH_MAX_ITEMS or tokens + size > REFINE_BATCH_MAX_TOKENS):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(idx)
+        tokens += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def packed_refine_request(questions: list[dict], batch: list[int], instruction: str):
+    # -> (messages, token estimate); the output is about as long as the input
+    from app.prompts.refine import REFINE_BATCH_PROMPT
+
+    items = [{"index": idx, "question": questions[idx]} for idx in batch]
+    prompt = REFINE_BATCH_PROMPT.format(
+        questions=json.dumps(items, indent=2),
+        instruction=instruction
+    )
+    messages = [
+        {
+            "role": "system",
+            "content": "You are a JSON API. Return ONLY valid JSON."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+    output = sum(count_tokens_batch([json.dumps(i) for i in items], LLM_MODEL)) * 3 // 2
+    return messages, estimate_chat_tokens(messages, output)
+
+
+def unpack_refinements(raw: str, batch: list[int]) -> dict[int, dict]:
+    """
+    Maps index -> refined question for the items of `batch` that came back
+    valid; anything missing or failing refined_problem is left out.
+    """
+    try:
+        parsed = json.loads(clean_json(raw))
+    except json.JSONDecodeError:
+        print(f"[WARN] Packed refine returned invalid JSON for {len(batch)} questions")
+        return {}
+    items = parsed.get("questions", []) if isinstance(parsed, dict) else parsed
+    wanted = set(batch)
+    refined = {}
+    for item in items if isinstance(items, list) else []:
+        index = item.get("index") if isinstance(item, dict) else None
+        # anything but a plain int (a list or dict is unhashable) is missing
+        if not isinstance(index, int) or isinstance(index, bool) or index not in wanted:
+            continue
+        problem = refined_problem(item.get("question"))
+        if problem:
+            print(f"[WARN] Packed refine: q {index} {problem}; refining it on its own")
+            continue
+        refined[index] = item["question"]
+    return refined
+
+
+async def refine_packed_async(questions: list[dict], batch: list[int], instruction: str) -> dict[int, dict]:
+    messages, estimate = packed_refine_request(questions, batch, instruction)
+    try:
+        res = await llm_scheduler.call_async(
+            async_client.chat.completions.create,
+            tokens=estimate,
+            lane="bulk",
+            model=LLM_MODEL,
+            messages=messages,
+            response_format={"type": "json_object"},
+            temperature=0.3
+        )
+    except Exception as e:
+        print(f"[ERROR] Packed refine failed for {len(batch)} questions: {e}")
+        return {}
+    return unpack_refinements(res.choices[0].message.content, batch)
+
+
+async def batch_refine_questions_async(questions: list[dict], instruction: str):
+    """
+    Refines multiple questions with as few calls as possible: questions are
+    packed into token-bounded batches (see pack_refinements), each refined
+    in one call, concurrently. Items a batch call drops or gets wrong fall
+    back to individual refine_question_async calls; an item that still
+    fails keeps its original.
+    """
+    batches = pack_refinements(questions)
+    print(f"[DEBUG] Refining {len(questions)} questions in {len(batches)} packed calls")
+
+    refined = {}
+    for result in await asyncio.gather(*(refine_packed_async(questions, b, instruction) for b in batches)):
+        refined.update(result)
+
+    async def process(idx):
         try:
-            return idx, refine_question(q, instruction)
+            return await refine_question_async(questions[idx], instruction, lane="bulk")
         except Exception as e:
             print(f"[ERROR] Batch refine failed for q {idx}: {e}")
-            return idx, q # Return original on failure
+            return questions[idx] # Return original on failure
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = [executor.submit(process, i, q) for i, q in enumerate(questions)]
-        
-        for future in as_completed(futures):
-            idx, res = future.result()
-            updated_questions[idx] = res
+    fallback = [idx for idx in range(len(questions)) if idx not in refined]
+    for idx, q in zip(fallback, await asyncio.gather(*(process(idx) for idx in fallback))):
+        refined[idx] = q
 
-    return updated_questions
+    return [refined.get(idx, q) for idx, q in enumerate(questions)]
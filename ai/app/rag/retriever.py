@@ -1,43 +1,173 @@
+import math
+
+import numpy as np
+
+from app.config import (
+    CHUNK_MAX_TOKENS,
+    RETRIEVAL_MIN_K,
+    RETRIEVAL_MAX_K,
+    QUESTIONS_PER_CHUNK,
+    RETRIEVAL_TOKEN_BUDGET,
+    MMR_LAMBDA,
+    MMR_FETCH_MULTIPLIER,
+    HYBRID_RRF_K,
+)
 from app.ingestion.embedder import embed
-from app.vectorstore.chroma import collection
+from app.vectorstore.router import router, Shard
+from app.vectorstore.registry import registry
+from app.vectorstore.lexical import lexical_store
+
+# Most chunks are packed close to the limit
+EST_TOKENS_PER_CHUNK = int(CHUNK_MAX_TOKENS * 0.9)
+
+
+def choose_k(count: int) -> int:
+    """
+    Number of chunks to retrieve for `count` questions: enough material for
+    roughly QUESTIONS_PER_CHUNK questions per chunk, capped by the context
+    token budget.
+    """
+    wanted = math.ceil(count / QUESTIONS_PER_CHUNK)
+    budget_cap = max(1, RETRIEVAL_TOKEN_BUDGET // EST_TOKENS_PER_CHUNK)
+    return max(RETRIEVAL_MIN_K, min(wanted, RETRIEVAL_MAX_K, budget_cap))
+
+
+def normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.where(norms == 0, 1, norms)
+
+
+def mmr(relevance: np.ndarray, candidates: np.ndarray, k: int, lambda_: float) -> list[int]:
+    """
+    Maximal Marginal Relevance: greedily picks candidates with high
+    `relevance` (one score per candidate, ~0..1) that are dissimilar to
+    what has already been picked. Returns indices into `candidates`.
+    """
+    candidates = normalize(candidates)
+    pairwise = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(candidates)):
+        redundancy = pairwise[:, selected].max(axis=1)
+        scores = lambda_ * relevance - (1 - lambda_) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
+
+
+def rrf(rankings: list[list[str]]) -> dict[str, float]:
+    """
+    Reciprocal Rank Fusion of several best-first id lists.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (HYBRID_RRF_K + rank + 1)
+    return scores
+
+
+def to_docs(documents, metadatas) -> list[dict]:
+    return [
+        {"text": doc, "source": meta["source"]}
+        for doc, meta in zip(documents, metadatas)
+        if doc and len(doc.strip()) > 50  # Ensure chunk has meaningful content
+    ]
+
+
+def retrieve_for_topic(shard: Shard, topic: str, k: int, chunk_count: int | None, query: list[float] | None = None):
+    """
+    Hybrid retrieval: dense candidates from Chroma and BM25 candidates from
+    the document's lexical index, fused with RRF, then diversified with MMR.
+    """
+    n_results = k * MMR_FETCH_MULTIPLIER
+    if chunk_count is not None:
+        n_results = min(n_results, chunk_count)
 
-def retrieve(document_id: str, k: int = 6):
-    print(f"[DEBUG] Retrieving docs for ID: {document_id}")
-    # Get all documents for the specific document_id
-    all_docs = collection.get(
-        where={"document_id": document_id}
+    if query is None:
+        query = embed(topic)
+    res = shard.collection.query(
+        query_embeddings=[query],
+        n_results=max(n_results, 1),
+        where=shard.where(),
+        include=["documents", "metadatas", "embeddings"]
     )
-    print(f"[DEBUG] Found {len(all_docs.get('documents', []))} matching docs in Chroma")
-
-    # If we have more documents than k, try to sample them evenly across sources
-    # to ensure coverage of the entire document
-    docs = []
-    if len(all_docs["documents"]) <= k:
-        # If we have fewer docs than k, return all of them
-        for doc, meta in zip(all_docs["documents"], all_docs["metadatas"]):
-            docs.append({
-                "text": doc,
-                "source": meta["source"]
-            })
+    pool = {
+        chunk_id: (doc, meta, emb)
+        for chunk_id, doc, meta, emb in zip(res["ids"][0], res["documents"][0], res["metadatas"][0], res["embeddings"][0])
+    }
+    dense_ranking = list(res["ids"][0])
+
+    lexical = lexical_store.get(shard.document_id)
+    lexical_ranking = [chunk_id for chunk_id, _ in lexical.search(topic, n_results)] if lexical else []
+
+    fused = rrf([dense_ranking, lexical_ranking])
+    ranked = sorted(fused, key=fused.get, reverse=True)[:max(n_results, 1)]
+    if not ranked:
+        return []
+
+    missing = [chunk_id for chunk_id in ranked if chunk_id not in pool]
+    if missing:
+        extra = shard.collection.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+        for chunk_id, doc, meta, emb in zip(extra["ids"], extra["documents"], extra["metadatas"], extra["embeddings"]):
+            pool[chunk_id] = (doc, meta, emb)
+        ranked = [chunk_id for chunk_id in ranked if chunk_id in pool]
+
+    relevance = np.asarray([fused[chunk_id] for chunk_id in ranked])
+    relevance = relevance / relevance.max()
+    embeddings = np.asarray([pool[chunk_id][2] for chunk_id in ranked])
+
+    picked = [ranked[i] for i in mmr(relevance, embeddings, k, MMR_LAMBDA)]
+    return to_docs([pool[i][0] for i in picked], [pool[i][1] for i in picked])
+
+
+def retrieve_spread(document_id: str, k: int, chunk_count: int, offset: float = 0.0, shard: Shard | None = None):
+    # Evenly spaced chunk positions cover the whole document without reading
+    # it all; `offset` (0..1 of a step) shifts the grid
+    step = max(chunk_count / k, 1)
+    positions = sorted({min(int((i + offset) * step), chunk_count - 1) for i in range(min(k, chunk_count))})
+
+    shard = shard or router.find(document_id)
+    if shard is None:
+        return []
+    res = shard.collection.get(
+        where=shard.where({"position": {"$in": positions}}),
+        include=["documents", "metadatas"]
+    )
+    items = sorted(zip(res["documents"], res["metadatas"]), key=lambda x: x[1].get("position", 0))
+    return to_docs([d for d, _ in items], [m for _, m in items])
+
+
+def retrieve_legacy(shard: Shard, k: int):
+    # Documents indexed before chunk positions were recorded: full scan
+    all_docs = shard.collection.get(where=shard.where())
+    sorted_items = sorted(zip(all_docs["documents"], all_docs["metadatas"]), key=lambda x: x[1]["source"])
+    if len(sorted_items) <= k:
+        return [{"text": d, "source": m["source"]} for d, m in sorted_items]
+
+    step = len(sorted_items) // k
+    picked = [sorted_items[i * step] for i in range(k)]
+    return to_docs([d for d, _ in picked], [m for _, m in picked])
+
+
+def retrieve(document_id: str, k: int = 6, topic: str | None = None, query_embedding: list[float] | None = None):
+    """
+    With a topic: hybrid (vector + BM25) search within the document,
+    diversified with MMR. Without one: chunks at evenly spaced positions
+    across the document. Async callers can pass the topic's embedding
+    (from embed_async) so this only does local reads.
+    """
+    print(f"[DEBUG] Retrieving {k} chunks for ID: {document_id} (topic: {topic!r})")
+    chunk_count = registry.chunk_count(document_id)
+    shard = router.find(document_id)
+
+    if chunk_count == 0 or shard is None:
+        docs = []
+    elif topic:
+        docs = retrieve_for_topic(shard, topic, k, chunk_count, query_embedding)
+    elif chunk_count is not None:
+        docs = retrieve_spread(document_id, k, chunk_count, shard=shard)
     else:
-        # If we have more docs than k, try to get even distribution across sources
-        # Sort by source to group similar sources together
-        sorted_items = sorted(
-            zip(all_docs["documents"], all_docs["metadatas"]),
-            key=lambda x: x[1]["source"]
-        )
-
-        # Select evenly spaced items to cover the whole document
-        step = len(sorted_items) // k
-        selected_indices = [i * step for i in range(k)]
-
-        for i in selected_indices:
-            if i < len(sorted_items):  # Safety check
-                doc, meta = sorted_items[i]
-                if doc and len(doc.strip()) > 50: # Ensure chunk has meaningful content
-                    docs.append({
-                        "text": doc,
-                        "source": meta["source"]
-                    })
+        docs = retrieve_legacy(shard, k)
 
+    print(f"[DEBUG] Retrieved {len(docs)} chunks for {document_id}")
     return docs
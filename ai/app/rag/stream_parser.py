@@ -0,0 +1,74 @@
+import json
+
+
+class QuestionStreamParser:
+    """
+    Incremental parser for a streamed {"questions": [{...}, ...]} (or bare
+    [{...}, ...]) completion. feed() takes text deltas as they arrive and
+    returns the question objects completed by them, so each can be handed
+    on before the rest of the array has been generated.
+
+    Only string/escape state and nesting depth are tracked; each completed
+    object is decoded with json.loads.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0          # next char of buffer to scan
+        self.stack = []       # open containers: "{" or "["
+        self.in_string = False
+        self.escaped = False
+        self.start = None     # buffer offset of the question being read
+        self.errors = 0
+
+    def feed(self, text: str) -> list[dict]:
+        self.buffer += text
+        completed = []
+
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                if ch == "{" and self.start is None and self.at_question_level():
+                    self.start = self.pos
+                self.stack.append(ch)
+            elif ch in "}]" and self.stack:
+                self.stack.pop()
+                if self.start is not None and ch == "}" and self.at_question_level():
+                    completed.extend(self.decode(self.buffer[self.start:self.pos + 1]))
+                    self.start = None
+            self.pos += 1
+
+        self.compact()
+        return completed
+
+    def at_question_level(self) -> bool:
+        # items of a top-level array, or of an array that is a value of the top-level object
+        return self.stack in (["["], ["{", "["])
+
+    def decode(self, text: str) -> list[dict]:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            self.errors += 1
+            print(f"[WARN] Stream parser: skipping undecodable question ({len(text)} chars)")
+            return []
+        return [item] if isinstance(item, dict) else []
+
+    def compact(self):
+        # Drop text that can no longer be part of a pending question
+        cut = self.start if self.start is not None else self.pos
+        if cut > 4096:
+            self.buffer = self.buffer[cut:]
+            self.pos -= cut
+            if self.start is not None:
+                self.start = 0
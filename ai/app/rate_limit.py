@@ -0,0 +1,294 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import openai
+
+from app.tokens import count_tokens, count_tokens_batch
+from app.config import (
+    LLM_MODEL,
+    EMBEDDING_MODEL,
+    LLM_REQUESTS_PER_MIN,
+    LLM_TOKENS_PER_MIN,
+    EMBED_REQUESTS_PER_MIN,
+    EMBED_TOKENS_PER_MIN,
+    RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_BACKOFF_BASE,
+    RATE_LIMIT_BACKOFF_MAX,
+)
+
+# Lower value = served first. Interactive edits beat quiz generation, which
+# beats bulk work (batch refinement, ingestion embeddings).
+LANES = {"interactive": 0, "generate": 1, "bulk": 2}
+
+# Errors worth waiting out; anything else goes straight back to the caller
+RETRYABLE = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+POLL_INTERVAL = 0.05
+
+
+class TokenBucket:
+    """
+    Refills continuously at `per_minute` units per minute, holding at most
+    one minute's worth.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # a request larger than the bucket is admitted once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def give_back(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class Scheduler:
+    """
+    Process-wide admission control for one OpenAI rate-limit group
+    (requests/min + tokens/min). Callers queue in priority lanes; only the
+    head of the queue may take from the buckets, so a bulk call never gets
+    ahead of a waiting interactive one. Both sync (ingestion threads) and
+    async (request handlers) callers share the same queue.
+
+    call()/call_async() also own retries: 429s and transient API errors
+    back off exponentially with jitter (or by Retry-After when the API
+    sends one), and a 429 pauses every lane, not just the caller.
+    """
+
+    def __init__(self, name: str, requests_per_min: int, tokens_per_min: int):
+        self.name = name
+        self.requests = TokenBucket(requests_per_min)
+        self.tokens = TokenBucket(tokens_per_min)
+        self.paused_until = 0.0
+        self.queue = []  # heap of (priority, seq)
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "throttled": 0,
+            "rate_limited": 0,
+            "retries": 0,
+            "failed": 0,
+            "wait_seconds": 0.0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0,
+        }
+
+    # --- admission ---
+
+    def _enqueue(self, lane: str):
+        ticket = (LANES[lane], next(self.seq))
+        with self.lock:
+            heapq.heappush(self.queue, ticket)
+        return ticket
+
+    def _try_admit(self, ticket, tokens: int) -> float:
+        """
+        Admits the ticket and returns 0, or returns how long to wait.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.queue[0] != ticket:
+                return POLL_INTERVAL
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            heapq.heappop(self.queue)
+            return 0.0
+
+    def _abandon(self, ticket):
+        with self.lock:
+            if ticket in self.queue:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+
+    def _record_wait(self, waited: float):
+        with self.lock:
+            self.stats["throttled"] += 1
+            self.stats["wait_seconds"] += waited
+
+    def acquire(self, tokens: int, lane: str):
+        ticket = self._enqueue(lane)
+        started = time.monotonic()
+        waited = False
+        try:
+            while (wait := self._try_admit(ticket, tokens)) > 0:
+                waited = True
+                time.sleep(min(wait, POLL_INTERVAL))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        if waited:
+            self._record_wait(time.monotonic() - started)
+
+    async def acquire_async(self, tokens: int, lane: str):
+        ticket = self._enqueue(lane)
+        started = time.monotonic()
+        waited = False
+        try:
+            while (wait := self._try_admit(ticket, tokens)) > 0:
+                waited = True
+                await asyncio.sleep(min(wait, POLL_INTERVAL))
+        except BaseException:
+            # includes cancellation when a client disconnects
+            self._abandon(ticket)
+            raise
+        if waited:
+            self._record_wait(time.monotonic() - started)
+
+    def settle(self, estimated: int, res):
+        """
+        Corrects the token bucket with the usage the API actually reported.
+        """
+        usage = getattr(res, "usage", None)
+        actual = getattr(usage, "total_tokens", None)
+        if actual is None:
+            return
+        # provider-side prompt caching, reported for chat completions
+        details = getattr(usage, "prompt_tokens_details", None)
+        with self.lock:
+            self.stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            self.stats["cached_prompt_tokens"] += getattr(details, "cached_tokens", 0) or 0
+            if actual < estimated:
+                self.tokens.give_back(estimated - actual)
+            else:
+                self.tokens.take(actual - estimated)
+
+    # --- retries ---
+
+    def _backoff(self, e: Exception, attempt: int) -> float:
+        delay = retry_after(e)
+        if delay is None:
+            delay = min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2 ** attempt)
+            delay = random.uniform(delay / 2, delay)  # jitter spreads out the retries
+        with self.lock:
+            self.stats["retries"] += 1
+            if isinstance(e, openai.RateLimitError):
+                self.stats["rate_limited"] += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        print(f"[WARN] {self.name}: {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt+1})")
+        return delay
+
+    def _give_up(self):
+        with self.lock:
+            self.stats["failed"] += 1
+
+    def call(self, fn, *, tokens: int, lane: str = "generate", **kwargs):
+        """
+        Runs fn(**kwargs) once admitted; `tokens` is the pre-call estimate
+        of prompt + completion tokens.
+        """
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            self.acquire(tokens, lane)
+            with self.lock:
+                self.stats["calls"] += 1
+            try:
+                res = fn(**kwargs)
+            except RETRYABLE as e:
+                if attempt == RATE_LIMIT_MAX_RETRIES:
+                    self._give_up()
+                    raise
+                time.sleep(self._backoff(e, attempt))
+                continue
+            self.settle(tokens, res)
+            return res
+
+    async def call_async(self, fn, *, tokens: int, lane: str = "generate", **kwargs):
+        """
+        Coroutine version of call() for async client methods.
+        """
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            await self.acquire_async(tokens, lane)
+            with self.lock:
+                self.stats["calls"] += 1
+            try:
+                res = await fn(**kwargs)
+            except RETRYABLE as e:
+                if attempt == RATE_LIMIT_MAX_RETRIES:
+                    self._give_up()
+                    raise
+                await asyncio.sleep(self._backoff(e, attempt))
+                continue
+            self.settle(tokens, res)
+            return res
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            depth = {lane: 0 for lane in LANES}
+            names = {v: k for k, v in LANES.items()}
+            for priority, _ in self.queue:
+                depth[names[priority]] += 1
+            now = time.monotonic()
+            prompt_tokens = self.stats["prompt_tokens"]
+            return {
+                **self.stats,
+                "wait_seconds": round(self.stats["wait_seconds"], 3),
+                "prompt_cache_hit_rate": round(self.stats["cached_prompt_tokens"] / prompt_tokens, 3) if prompt_tokens else 0.0,
+                "queue_depth": depth,
+                "paused_for": round(max(0.0, self.paused_until - now), 3),
+            }
+
+
+def estimate_chat_tokens(messages: list[dict], output_tokens: int) -> int:
+    # prompt tokens plus a few per message for the chat framing
+    return sum(count_tokens(m["content"], LLM_MODEL) + 4 for m in messages) + output_tokens
+
+
+def estimate_embedding_tokens(texts: list[str]) -> int:
+    return sum(count_tokens_batch(texts, EMBEDDING_MODEL))
+
+
+def retry_after(e: Exception) -> float | None:
+    # OpenAI sends retry-after-ms and/or retry-after (seconds)
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+llm_scheduler = Scheduler("chat", LLM_REQUESTS_PER_MIN, LLM_TOKENS_PER_MIN)
+embedding_scheduler = Scheduler("embeddings", EMBED_REQUESTS_PER_MIN, EMBED_TOKENS_PER_MIN)
+
+
+def snapshot() -> dict:
+    return {
+        "chat": llm_scheduler.snapshot(),
+        "embeddings": embedding_scheduler.snapshot(),
+    }
@@ -0,0 +1,41 @@
+from functools import lru_cache
+
+from app.config import EMBEDDING_MODEL
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use; offline hosts can't
+        print(f"[WARN] tiktoken encoding for {model} unavailable ({e}); estimating tokens from length")
+        return None
+
+
+def count_tokens(text: str, model: str = EMBEDDING_MODEL) -> int:
+    """
+    Token count under `model`'s tokenizer. Without tiktoken, falls back to
+    ~4 characters per token.
+    """
+    enc = get_encoding(model)
+    if enc is None:
+        return len(text) // 4 + 1
+    return len(enc.encode_ordinary(text))
+
+
+def count_tokens_batch(texts: list[str], model: str = EMBEDDING_MODEL) -> list[int]:
+    enc = get_encoding(model)
+    if enc is None:
+        return [len(t) // 4 + 1 for t in texts]
+    return [len(ids) for ids in enc.encode_ordinary_batch(texts)]
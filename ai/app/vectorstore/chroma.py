@@ -1,9 +1,39 @@
+import os
+import threading
+
 import chromadb
-from app.config import VECTOR_DB_PATH, COLLECTION_NAME
+from chromadb.config import Settings
+from app.config import VECTOR_STATE_DIR, VECTOR_MEMORY_LIMIT_BYTES, CHROMA_HOST, CHROMA_PORT
+
+DB_DIR = VECTOR_STATE_DIR
+# also holds the SQLite state shared by workers, even with a remote store
+os.makedirs(DB_DIR, exist_ok=True)
+
+# The client is opened on first use, once per process (a client inherited
+# through fork is never reused). Collections are opened through
+# app.vectorstore.router.
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def remote() -> bool:
+    return CHROMA_HOST is not None
 
-# Connect to local Chroma (persistent)
-import os
-DB_DIR = os.path.join(os.path.dirname(__file__), "../../chroma_db")
-client = chromadb.PersistentClient(path=DB_DIR)
 
-collection = client.get_or_create_collection(COLLECTION_NAME)
+def get_client():
+    global _client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            if remote():
+                # a Chroma server owns the store; safe with many workers
+                _client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+            else:
+                settings = Settings(
+                    chroma_segment_cache_policy="LRU",
+                    chroma_memory_limit_bytes=VECTOR_MEMORY_LIMIT_BYTES
+                ) if VECTOR_MEMORY_LIMIT_BYTES else Settings()
+                _client = chromadb.PersistentClient(path=DB_DIR, settings=settings)
+            _client_pid = os.getpid()
+            print(f"[DEBUG] Opened Chroma client ({'http://%s:%d' % (CHROMA_HOST, CHROMA_PORT) if remote() else DB_DIR}) in pid {_client_pid}")
+        return _client
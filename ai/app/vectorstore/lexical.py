@@ -0,0 +1,168 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from app.vectorstore.chroma import DB_DIR
+
+LEXICAL_DIR = os.path.join(DB_DIR, "lexical")
+
+# Keeps identifiers like `std::vector`, `ERR_CONN_RESET`, `v1.2.3` or
+# `/api/users` as single terms; their parts are indexed as well.
+TOKEN_RE = re.compile(r"[a-z0-9_]+(?:[.\-:/][a-z0-9_]+)*")
+PART_RE = re.compile(r"[a-z0-9_]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "was", "with",
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    terms = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token not in STOPWORDS:
+            terms.append(token)
+        parts = PART_RE.findall(token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p not in STOPWORDS)
+    return terms
+
+
+class LexicalIndex:
+    """
+    Inverted index with BM25 statistics for the chunks of one document.
+    postings: term -> {chunk_id: term frequency}; lengths: chunk_id -> terms.
+    """
+
+    def __init__(self, postings: dict | None = None, lengths: dict | None = None):
+        self.postings = postings or {}
+        self.lengths = lengths or {}
+        self.total_length = sum(self.lengths.values())
+
+    def add(self, chunk_id: str, text: str):
+        if chunk_id in self.lengths:
+            self.remove(chunk_id)
+        terms = tokenize(text)
+        for term, tf in Counter(terms).items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        self.lengths[chunk_id] = len(terms)
+        self.total_length += len(terms)
+
+    def remove(self, chunk_id: str):
+        self.remove_many([chunk_id])
+
+    def remove_many(self, chunk_ids):
+        chunk_ids = {c for c in chunk_ids if c in self.lengths}
+        if not chunk_ids:
+            return
+        # No forward index is kept, so walk the postings once per call
+        for term in list(self.postings):
+            docs = self.postings[term]
+            for chunk_id in chunk_ids.intersection(docs):
+                del docs[chunk_id]
+            if not docs:
+                del self.postings[term]
+        for chunk_id in chunk_ids:
+            self.total_length -= self.lengths.pop(chunk_id)
+
+    def search(self, query: str, limit: int) -> list[tuple[str, float]]:
+        """
+        Returns up to `limit` (chunk_id, bm25 score) pairs, best first.
+        """
+        n = len(self.lengths)
+        if n == 0:
+            return []
+        avg_len = self.total_length / n or 1.0
+
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for chunk_id, tf in docs.items():
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunk_id] / avg_len)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+
+    def copy(self) -> "LexicalIndex":
+        # loaded indexes are shared with readers; edit a copy and save it
+        return LexicalIndex({term: dict(docs) for term, docs in self.postings.items()}, dict(self.lengths))
+
+    def to_dict(self) -> dict:
+        return {"postings": self.postings, "lengths": self.lengths}
+
+
+class LexicalStore:
+    """
+    Persists one LexicalIndex per document as JSON under `root`, with a
+    small LRU of loaded indexes so repeated lookups skip the disk. A loaded
+    index is reloaded when its file changed (rewritten by another worker).
+    """
+
+    def __init__(self, root: str, max_loaded: int = 64):
+        self.root = root
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def path(self, document_id: str) -> str:
+        # hashed, so ids like "a/b", "a:b" and "a_b" never share a file
+        digest = hashlib.sha256(document_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.root, f"{digest}.json")
+
+    def get(self, document_id: str) -> LexicalIndex | None:
+        path = self.path(document_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            with self.lock:
+                self.loaded.pop(document_id, None)
+            return None
+        with self.lock:
+            entry = self.loaded.get(document_id)
+            if entry is not None and entry[1] == mtime:
+                self.loaded.move_to_end(document_id)
+                return entry[0]
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        index = LexicalIndex(data["postings"], data["lengths"])
+        self._remember(document_id, index, mtime)
+        return index
+
+    def save(self, document_id: str, index: LexicalIndex):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(document_id)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(index.to_dict(), f)
+        os.replace(tmp, path)
+        self._remember(document_id, index, os.stat(path).st_mtime_ns)
+
+    def delete(self, document_id: str):
+        with self.lock:
+            self.loaded.pop(document_id, None)
+        try:
+            os.remove(self.path(document_id))
+        except FileNotFoundError:
+            pass
+
+    def _remember(self, document_id: str, index: LexicalIndex, mtime: int):
+        with self.lock:
+            self.loaded[document_id] = (index, mtime)
+            self.loaded.move_to_end(document_id)
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+
+
+lexical_store = LexicalStore(LEXICAL_DIR)
@@ -0,0 +1,63 @@
+import argparse
+from collections import defaultdict
+
+from app.config import COLLECTION_NAME
+from app.vectorstore.router import router
+
+# Moves chunks from the legacy single collection into the shards chosen by
+# VECTOR_SHARD_BY. Run it from the ai/ directory with ingestion stopped:
+#
+#     python -m app.vectorstore.migrate [--batch N] [--drop]
+#
+# Writes are upserts, so an interrupted run can simply be repeated. Until
+# --drop removes the legacy collection, documents without a shard keep
+# being read from it.
+
+MIGRATE_BATCH = 1000
+
+
+def migrate(batch_size: int = MIGRATE_BATCH, drop: bool = False) -> dict:
+    if router.shard_by == "single":
+        print("[WARN] VECTOR_SHARD_BY is 'single'; nothing to migrate")
+        return {"chunks": 0, "documents": 0}
+    try:
+        legacy = router.client.get_collection(COLLECTION_NAME)
+    except Exception:
+        print(f"[DEBUG] No legacy collection {COLLECTION_NAME!r}; nothing to migrate")
+        return {"chunks": 0, "documents": 0}
+
+    total = legacy.count()
+    documents = set()
+    moved = 0
+    for offset in range(0, total, batch_size):
+        res = legacy.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+
+        by_document = defaultdict(list)
+        for row in zip(res["ids"], res["documents"], res["metadatas"], res["embeddings"]):
+            by_document[row[2]["document_id"]].append(row)
+
+        for document_id, rows in by_document.items():
+            ids, texts, metadatas, embeddings = zip(*rows)
+            router.shard(document_id).collection.upsert(
+                ids=list(ids),
+                documents=list(texts),
+                metadatas=list(metadatas),
+                embeddings=[list(e) for e in embeddings]
+            )
+            documents.add(document_id)
+        moved += len(res["ids"])
+        print(f"[DEBUG] Migrated {moved}/{total} chunks ({len(documents)} documents)")
+
+    if drop:
+        router.client.delete_collection(COLLECTION_NAME)
+        router.open.pop(COLLECTION_NAME, None)
+        print(f"[DEBUG] Dropped legacy collection {COLLECTION_NAME!r}")
+    return {"chunks": moved, "documents": len(documents)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move the legacy Chroma collection into sharded collections")
+    parser.add_argument("--batch", type=int, default=MIGRATE_BATCH, help="chunks read per request")
+    parser.add_argument("--drop", action="store_true", help="delete the legacy collection afterwards")
+    args = parser.parse_args()
+    print(migrate(args.batch, args.drop))
@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import threading
+import time
+
+from app.config import SQLITE_BUSY_TIMEOUT
+from app.vectorstore.chroma import DB_DIR
+
+REGISTRY_PATH = os.path.join(DB_DIR, "documents.sqlite3")
+
+# Columns added after the first release; created on open if missing
+COLUMNS = {
+    "text_bytes": "INTEGER NOT NULL DEFAULT 0",
+    "expires_at": "REAL",
+}
+
+
+class DocumentRegistry:
+    """
+    Small per-document bookkeeping table kept next to the Chroma store,
+    so reads like "how many chunks does this document have" or "which
+    documents have expired" never need a scan of the collection.
+    """
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                chunk_count INTEGER NOT NULL,
+                indexed_at REAL NOT NULL
+            )
+            """
+        )
+        present = {row[1] for row in self.db.execute("PRAGMA table_info(documents)")}
+        for name, spec in COLUMNS.items():
+            if name not in present:
+                try:
+                    self.db.execute(f"ALTER TABLE documents ADD COLUMN {name} {spec}")
+                except sqlite3.OperationalError:
+                    pass  # added by another worker starting at the same time
+        self.db.execute("CREATE INDEX IF NOT EXISTS documents_expiry ON documents (expires_at)")
+        self.db.commit()
+
+    def record_indexed(self, document_id: str, chunk_count: int, text_bytes: int = 0):
+        # upsert, so an expiry set for the document survives re-indexing
+        with self.lock:
+            self.db.execute(
+                """
+                INSERT INTO documents (document_id, chunk_count, indexed_at, text_bytes) VALUES (?, ?, ?, ?)
+                ON CONFLICT(document_id) DO UPDATE SET
+                    chunk_count = excluded.chunk_count,
+                    indexed_at = excluded.indexed_at,
+                    text_bytes = excluded.text_bytes
+                """,
+                (document_id, chunk_count, time.time(), text_bytes)
+            )
+            self.db.commit()
+
+    def chunk_count(self, document_id: str) -> int | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT chunk_count FROM documents WHERE document_id = ?",
+                (document_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_expiry(self, document_id: str, expires_at: float | None):
+        with self.lock:
+            self.db.execute("UPDATE documents SET expires_at = ? WHERE document_id = ?", (expires_at, document_id))
+            self.db.commit()
+
+    def expired(self, now: float | None = None) -> list[str]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT document_id FROM documents WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (now if now is not None else time.time(),)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def get(self, document_id: str) -> dict | None:
+        rows = self._select("WHERE document_id = ?", (document_id,))
+        return rows[0] if rows else None
+
+    def all(self) -> list[dict]:
+        return self._select("ORDER BY indexed_at DESC", ())
+
+    def forget(self, document_id: str):
+        with self.lock:
+            self.db.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+            self.db.commit()
+
+    def _select(self, clause: str, args: tuple) -> list[dict]:
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT document_id, chunk_count, text_bytes, indexed_at, expires_at FROM documents {clause}",
+                args
+            ).fetchall()
+        return [
+            {"document_id": r[0], "chunk_count": r[1], "text_bytes": r[2], "indexed_at": r[3], "expires_at": r[4]}
+            for r in rows
+        ]
+
+
+registry = DocumentRegistry(REGISTRY_PATH)
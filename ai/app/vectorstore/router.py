@@ -0,0 +1,244 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import (
+    COLLECTION_NAME,
+    VECTOR_SHARD_BY,
+    TENANT_SEPARATOR,
+    VECTOR_HNSW_PARAMS,
+    VECTOR_MAX_OPEN_COLLECTIONS,
+    VECTOR_REMOTE_HANDLE_TTL,
+)
+from app.vectorstore.chroma import get_client, remote
+
+
+def collection_missing(e: Exception) -> bool:
+    # NotFoundError / InvalidCollectionException / ValueError depending on
+    # the Chroma version
+    return type(e).__name__ in ("NotFoundError", "InvalidCollectionException") or "does not exist" in str(e)
+
+
+class Handle:
+    """
+    A collection handle that survives the collection being dropped and
+    re-created by another worker: a call failing because the collection no
+    longer exists is retried once on the handle `reopen` returns (None if
+    there is nothing to reopen, and the call fails).
+    """
+
+    def __init__(self, collection, reopen):
+        self.collection = collection
+        self.reopen = reopen
+
+    def __getattr__(self, attr):
+        value = getattr(self.collection, attr)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            try:
+                return getattr(self.collection, attr)(*args, **kwargs)
+            except Exception as e:
+                if not collection_missing(e):
+                    raise
+                collection = self.reopen()
+                if collection is None:
+                    raise
+                print(f"[WARN] Collection {self.collection.name} was dropped; retrying {attr} on a fresh handle")
+                self.collection = collection
+                return getattr(collection, attr)(*args, **kwargs)
+
+        return call
+
+
+class Shard:
+    """
+    The collection holding one document's chunks. `scoped` shards are
+    shared with other documents, so reads must filter on document_id;
+    where() builds that filter.
+    """
+
+    def __init__(self, collection, document_id: str, scoped: bool):
+        self.collection = collection
+        self.document_id = document_id
+        self.scoped = scoped
+
+    def where(self, extra: dict | None = None) -> dict | None:
+        if not self.scoped:
+            return extra
+        if extra is None:
+            return {"document_id": self.document_id}
+        return {"$and": [{"document_id": self.document_id}, extra]}
+
+
+class CollectionRouter:
+    """
+    Maps documents to Chroma collections by `shard_by` ("document",
+    "tenant" or "single"). Collections are opened lazily and the handles
+    of the `max_open` most recently used ones are kept (per process, and
+    only for `handle_ttl` seconds when another process may drop them).
+
+    Until `python -m app.vectorstore.migrate` has run, documents without a
+    shard (or, sharding by tenant, without rows in their tenant's shard)
+    are read from the legacy single collection if it exists.
+    """
+
+    def __init__(self, connect, shard_by: str, hnsw: dict, max_open: int, handle_ttl: float | None = None):
+        if shard_by not in ("document", "tenant", "single"):
+            raise ValueError(f"Unknown VECTOR_SHARD_BY: {shard_by}")
+        self.connect = connect
+        self.shard_by = shard_by
+        self.hnsw = hnsw.get(shard_by, {})
+        self.max_open = max_open
+        self.handle_ttl = handle_ttl
+        self.open = OrderedDict()  # name -> (collection, opened_at)
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    @property
+    def client(self):
+        return self.connect()
+
+    def name(self, document_id: str) -> str:
+        if self.shard_by == "single":
+            return COLLECTION_NAME
+        key = document_id
+        if self.shard_by == "tenant":
+            key = document_id.split(TENANT_SEPARATOR, 1)[0] if TENANT_SEPARATOR in document_id else "default"
+        # Chroma names are restricted to short [a-zA-Z0-9._-] strings
+        return f"{self.shard_by}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}"
+
+    def shard(self, document_id: str) -> Shard:
+        """
+        The document's shard for writes, created if needed.
+        """
+        name = self.name(document_id)
+        collection = self._cached(name)
+        if collection is None:
+            collection = self._create(name, document_id)
+
+        def reopen():
+            self.evict(name)
+            return self._create(name, document_id)
+
+        return Shard(Handle(collection, reopen), document_id, scoped=self.shard_by != "document")
+
+    def find(self, document_id: str) -> Shard | None:
+        """
+        The document's shard for reads, or None if nothing is stored for it.
+        """
+        name = self.name(document_id)
+        collection = self._open(name)
+        if collection is None:
+            return self.legacy(document_id)
+        shard = Shard(self._handle(name, collection), document_id, scoped=self.shard_by != "document")
+        if self.shard_by == "tenant" and not shard.collection.get(where=shard.where(), limit=1, include=[])["ids"]:
+            # the tenant's shard exists but this document was not migrated yet
+            return self.legacy(document_id) or shard
+        return shard
+
+    def legacy(self, document_id: str) -> Shard | None:
+        # the pre-sharding collection, while it still exists
+        if self.shard_by == "single":
+            return None
+        collection = self._open(COLLECTION_NAME)
+        if collection is None:
+            return None
+        return Shard(self._handle(COLLECTION_NAME, collection), document_id, scoped=True)
+
+    def retire_legacy(self, document_id: str):
+        """
+        Deletes the document's chunks from the legacy collection, once they
+        have been written to (or deleted from) its shard.
+        """
+        shard = self.legacy(document_id)
+        if shard is not None:
+            shard.collection.delete(where=shard.where())
+
+    def drop(self, document_id: str):
+        """
+        Deletes all of a document's chunks: the whole collection for a
+        per-document shard, a filtered bulk delete otherwise.
+        """
+        name = self.name(document_id)
+        collection = self._open(name)
+        if collection is not None:
+            if self.shard_by == "document":
+                self.evict(name)
+                try:
+                    self.client.delete_collection(name)
+                except Exception as e:
+                    # already dropped by another worker
+                    if not collection_missing(e):
+                        raise
+            else:
+                self._handle(name, collection).delete(where={"document_id": document_id})
+        self.retire_legacy(document_id)
+
+    def evict(self, name: str):
+        with self.lock:
+            self.open.pop(name, None)
+
+    def _create(self, name: str, document_id: str):
+        metadata = dict(self.hnsw, shard_key=document_id) if self.shard_by == "document" else dict(self.hnsw)
+        collection = self.client.get_or_create_collection(name, metadata=metadata or None)
+        self._remember(name, collection)
+        return collection
+
+    def _handle(self, name: str, collection) -> Handle:
+        # reads don't re-create a dropped collection, they only pick up
+        # one re-created by another worker
+        def reopen():
+            self.evict(name)
+            return self._get(name)
+
+        return Handle(collection, reopen)
+
+    def _open(self, name: str):
+        collection = self._cached(name)
+        return collection if collection is not None else self._get(name)
+
+    def _get(self, name: str):
+        try:
+            collection = self.client.get_collection(name)
+        except Exception as e:
+            if not collection_missing(e):
+                raise
+            return None
+        self._remember(name, collection)
+        return collection
+
+    def _cached(self, name: str):
+        with self.lock:
+            if self.pid != os.getpid():
+                # handles inherited through fork belong to the parent's client
+                self.open.clear()
+                self.pid = os.getpid()
+            entry = self.open.get(name)
+            if entry is None:
+                return None
+            collection, opened_at = entry
+            if self.handle_ttl is not None and time.monotonic() - opened_at > self.handle_ttl:
+                del self.open[name]
+                return None
+            self.open.move_to_end(name)
+            return collection
+
+    def _remember(self, name: str, collection):
+        with self.lock:
+            self.open[name] = (collection, time.monotonic())
+            self.open.move_to_end(name)
+            while len(self.open) > self.max_open:
+                self.open.popitem(last=False)
+
+
+router = CollectionRouter(
+    get_client,
+    VECTOR_SHARD_BY,
+    VECTOR_HNSW_PARAMS,
+    VECTOR_MAX_OPEN_COLLECTIONS,
+    handle_ttl=VECTOR_REMOTE_HANDLE_TTL if remote() else None
+)
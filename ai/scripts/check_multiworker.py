@@ -0,0 +1,211 @@
+import argparse
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from pptx import Presentation
+
+# Runs N uvicorn workers against one Chroma server and one shared state
+# directory, then uploads decks and generates questions concurrently and
+# checks that every worker sees the same documents and jobs.
+#
+#     cd ai && python scripts/check_multiworker.py --workers 4
+#
+# OpenAI calls are real: set OPENAI_API_KEY (or OPENAI_BASE_URL to a
+# compatible endpoint). Everything else runs in a temp directory.
+
+AI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+WORDS = (
+    "cache replica shard leader follower quorum latency throughput backpressure "
+    "partition index compaction snapshot checkpoint lease heartbeat retry timeout "
+    "consistency isolation transaction commit rollback queue batch stream window"
+).split()
+
+
+def make_deck(path: str, seed: int, slides: int = 12):
+    rng = random.Random(seed)
+    deck = Presentation()
+    for i in range(slides):
+        slide = deck.slides.add_slide(deck.slide_layouts[1])
+        slide.shapes.title.text = f"Deck {seed} topic {i}: {rng.choice(WORDS)} and {rng.choice(WORDS)}"
+        slide.placeholders[1].text = "\n".join(
+            " ".join(rng.choice(WORDS) for _ in range(18)).capitalize() + "."
+            for _ in range(8)
+        )
+    deck.save(path)
+
+
+def wait_until_up(url: str, proc, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with {proc.returncode}")
+        try:
+            httpx.get(url, timeout=2)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up in {timeout}s")
+
+
+def upload(base: str, path: str, document_id: str, ttl_seconds: int | None = None) -> dict:
+    data = {"document_id": document_id}
+    if ttl_seconds is not None:
+        data["ttl_seconds"] = str(ttl_seconds)
+    with open(path, "rb") as f:
+        res = httpx.post(
+            f"{base}/upload",
+            files={"file": (os.path.basename(path), f, "application/vnd.openxmlformats-officedocument.presentationml.presentation")},
+            data=data,
+            timeout=60
+        )
+    res.raise_for_status()
+    return res.json()
+
+
+def wait_for_job(base: str, job_id: str, timeout: float) -> dict:
+    # polled through the shared port, so different workers answer
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        res = httpx.get(f"{base}/jobs/{job_id}", timeout=10)
+        res.raise_for_status()
+        job = res.json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.5)
+    raise RuntimeError(f"job {job_id} did not finish in {timeout}s")
+
+
+def generate(base: str, document_id: str) -> int:
+    res = httpx.post(
+        f"{base}/generate",
+        json={"document_id": document_id, "difficulty": "medium", "count": 5, "mode": "mcq", "options": 4},
+        timeout=180
+    )
+    if res.status_code == 200 and not res.json().get("questions"):
+        return 599  # empty result counts as a failure
+    return res.status_code
+
+
+def run(args) -> bool:
+    work = tempfile.mkdtemp(prefix="multiworker-")
+    env = dict(
+        os.environ,
+        CHROMA_HOST="localhost",
+        CHROMA_PORT=str(args.chroma_port),
+        WORKER_PROCESSES=str(args.workers),
+        VECTOR_STATE_DIR=os.path.join(work, "state"),
+        QUESTION_BANK_ENABLED="false",
+    )
+    chroma = subprocess.Popen(
+        ["chroma", "run", "--path", os.path.join(work, "chroma"), "--port", str(args.chroma_port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT
+    )
+    app = None
+    log = open(os.path.join(work, "app.log"), "w")
+    try:
+        wait_until_up(f"http://localhost:{args.chroma_port}/api/v2/heartbeat", chroma, 60)
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--workers", str(args.workers)],
+            cwd=AI_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        base = f"http://localhost:{args.port}"
+        wait_until_up(f"{base}/documents", app, 120)
+
+        decks = []
+        for i in range(args.docs * 2):
+            path = os.path.join(work, f"deck{i}.pptx")
+            make_deck(path, i)
+            decks.append((path, f"doc-{i}"))
+        first, second = decks[:args.docs], decks[args.docs:]
+
+        ok = True
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            # 1. concurrent uploads, each deck submitted twice: the duplicate
+            #    must get the same job even when another worker takes it
+            started = time.time()
+            submitted = list(pool.map(lambda d: upload(base, *d), first + first))
+            job_ids = {s["document_id"]: s["job_id"] for s in submitted[:len(first)]}
+            duplicates = sum(1 for s in submitted[len(first):] if s["job_id"] != job_ids[s["document_id"]])
+            jobs = list(pool.map(lambda j: wait_for_job(base, j, args.timeout), job_ids.values()))
+            failed = [j for j in jobs if j["status"] != "done"]
+            print(f"uploads: {len(jobs)} done in {time.time() - started:.1f}s, {len(failed)} failed, {duplicates} duplicate jobs")
+            ok &= not failed and not duplicates
+
+            # 2. generation for the indexed decks while the second batch uploads
+            started = time.time()
+            uploads = [pool.submit(upload, base, *d) for d in second]
+            targets = [first[i % len(first)][1] for i in range(args.generates)]
+            statuses = list(pool.map(lambda d: generate(base, d), targets))
+            jobs = [wait_for_job(base, u.result()["job_id"], args.timeout) for u in uploads]
+            errors = [s for s in statuses if s != 200]
+            failed = [j for j in jobs if j["status"] != "done"]
+            print(f"generate under upload load: {len(statuses)} requests in {time.time() - started:.1f}s, "
+                  f"{len(errors)} errors {sorted(set(errors))}, {len(failed)} uploads failed")
+            ok &= not errors and not failed
+
+        # 3. every worker agrees on the registry and the chunk counts
+        counts = {}
+        for _ in range(args.workers * 4):
+            listed = httpx.get(f"{base}/documents", timeout=30).json()["documents"]
+            counts.setdefault(tuple(sorted((d["document_id"], d["chunk_count"]) for d in listed)), 0)
+        consistent = len(counts) == 1 and len(next(iter(counts))) == len(decks)
+        print(f"registry views: {len(counts)} distinct, {len(next(iter(counts)))} documents")
+        ok &= consistent
+
+        # 4. delete through one worker, gone for all
+        deleted = httpx.delete(f"{base}/documents/{first[0][1]}", timeout=30).status_code
+        gone = all(httpx.get(f"{base}/documents/{first[0][1]}", timeout=10).status_code == 404 for _ in range(args.workers * 2))
+        print(f"delete: {deleted}, gone everywhere: {gone}")
+        ok &= deleted == 200 and gone
+
+        # 5. the same file uploaded again after the delete is indexed again
+        #    (not answered with the old done job) and takes the new ttl
+        again = upload(base, *first[0], ttl_seconds=3600)
+        job = wait_for_job(base, again["job_id"], args.timeout)
+        res = httpx.get(f"{base}/documents/{first[0][1]}", timeout=10)
+        stats = res.json() if res.status_code == 200 else {}
+        reindexed = (
+            again["job_id"] != job_ids[first[0][1]] and job["status"] == "done"
+            and stats.get("chunk_count", 0) > 0 and stats.get("expires_at") is not None
+        )
+        print(f"re-upload after delete: job {job['status']}, new job: {again['job_id'] != job_ids[first[0][1]]}, "
+              f"{stats.get('chunk_count', 0)} chunks, expires_at set: {stats.get('expires_at') is not None}")
+        ok &= reindexed
+        return ok
+    finally:
+        for proc in (app, chroma):
+            if proc is not None and proc.poll() is None:
+                proc.send_signal(signal.SIGINT)
+                try:
+                    proc.wait(timeout=20)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        log.close()
+        if args.keep:
+            print(f"kept {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the ai service with several workers sharing one store")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--docs", type=int, default=6, help="decks per upload batch")
+    parser.add_argument("--generates", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--chroma-port", type=int, default=8011)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for a job")
+    parser.add_argument("--keep", action="store_true", help="keep the temp directory (app.log, state)")
+    args = parser.parse_args()
+    passed = run(args)
+    print("PASS" if passed else "FAIL")
+    sys.exit(0 if passed else 1)